@@ -1,4 +1,6 @@
 """App namespace template loader"""
+from app_namespace.cached import CachedLoader
 from app_namespace.loader import Loader
 
-__all__ = [Loader.__name__]
+__all__ = [Loader.__name__,
+           CachedLoader.__name__]
@@ -0,0 +1,81 @@
+"""Asynchronous helpers for app-namespace, requiring Python >= 3.4"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_loop(loop=None):
+    return loop or asyncio.get_event_loop()
+
+
+def get_executor(max_workers):
+    """
+    Return the bounded executor for the file operations shared by the
+    loaders of the process, created with 'max_workers' threads on first
+    use and recreated in the processes forked after.
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=max_workers)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def map_in_executor(loop, executor, function, items):
+    """
+    Return a future of the list of 'function(item)' for each item,
+    the calls being run concurrently in the executor.
+    """
+    if not items:
+        result = asyncio.Future(loop=loop)
+        result.set_result([])
+        return result
+    return asyncio.gather(*[loop.run_in_executor(executor, function, item)
+                            for item in items])
+
+
+def then(loop, future, callback):
+    """
+    Return a future resolved with 'callback(future.result())'
+    once 'future' is done. If 'callback' returns a future,
+    the returned future is resolved with its result.
+    """
+    result = asyncio.Future(loop=loop)
+
+    def transfer(done):
+        if result.done():
+            return
+        if done.cancelled():
+            result.cancel()
+        elif done.exception() is not None:
+            result.set_exception(done.exception())
+        else:
+            result.set_result(done.result())
+
+    def chain(done):
+        if result.done():
+            return
+        if done.cancelled():
+            result.cancel()
+            return
+        if done.exception() is not None:
+            result.set_exception(done.exception())
+            return
+        try:
+            value = callback(done.result())
+        except Exception as exception:
+            result.set_exception(exception)
+            return
+        if isinstance(value, asyncio.Future):
+            value.add_done_callback(transfer)
+        else:
+            result.set_result(value)
+
+    future.add_done_callback(chain)
+    return result
@@ -0,0 +1,196 @@
+"""Benchmark of the app namespace template loader"""
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+import django
+from django.template import Context
+from django.template.engine import Engine
+from django.test.utils import override_settings
+
+APP_LOADER = 'app_namespace.Loader'
+CACHED_LOADER = 'app_namespace.CachedLoader'
+BASELINE_LOADER = 'django.template.loaders.app_directories.Loader'
+
+
+class SyntheticProject(object):
+    """
+    Temporary project of 'apps' applications providing 'templates'
+    templates each. The first 'depth' applications also provide
+    the chain templates, extending each other with empty namespaces.
+    """
+    template_base = (
+        '{%% block content %%}%(app)s{%% endblock content %%}')
+    template_extend = (
+        '{%% extends ":%(name)s" %%}'
+        '{%% block content %%}%(app)s {{ block.super }}'
+        '{%% endblock content %%}')
+
+    def __init__(self, apps=10, templates=10, depth=3, prefix='synthetic'):
+        self.depth = min(depth, apps)
+        self.templates = templates
+        self.apps = ['%s_app_%s' % (prefix, i) for i in range(apps)]
+        self.directory = None
+
+    def chain_name(self, index):
+        return 'chain/template_%s.html' % index
+
+    def app_name(self, app, index):
+        return '%s/template_%s.html' % (app, index)
+
+    def write(self, path, content):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fp:
+            fp.write(content)
+
+    def create(self):
+        """
+        Write the applications in a temporary directory
+        added to the PYTHONPATH.
+        """
+        self.directory = tempfile.mkdtemp()
+        sys.path.append(self.directory)
+        for position, app in enumerate(self.apps):
+            app_path = os.path.join(self.directory, app)
+            templates_dir = os.path.join(app_path, 'templates')
+            self.write(os.path.join(app_path, '__init__.py'), '')
+            for index in range(self.templates):
+                self.write(
+                    os.path.join(templates_dir, self.app_name(app, index)),
+                    self.template_base % {'app': app})
+                if position < self.depth:
+                    template = (position == self.depth - 1 and
+                                self.template_base or self.template_extend)
+                    self.write(
+                        os.path.join(templates_dir, self.chain_name(index)),
+                        template % {'app': app,
+                                    'name': self.chain_name(index)})
+        return self
+
+    def destroy(self):
+        sys.path.remove(self.directory)
+        for app in self.apps:
+            sys.modules.pop(app, None)
+        shutil.rmtree(self.directory)
+        self.directory = None
+
+    def __enter__(self):
+        self.create()
+        self.settings = override_settings(INSTALLED_APPS=self.apps)
+        self.settings.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.settings.disable()
+        self.destroy()
+
+
+def build_engine(loader):
+    if loader == CACHED_LOADER:
+        return Engine(loaders=[(CACHED_LOADER, [APP_LOADER])])
+    return Engine(loaders=[loader])
+
+
+def measure(function, names, repeat):
+    """
+    Return the duration of the first call of 'function' on each name,
+    and the mean duration of the next 'repeat' calls.
+    """
+    start = default_timer()
+    for name in names:
+        function(name)
+    cold = (default_timer() - start) / len(names)
+
+    start = default_timer()
+    for i in range(repeat):
+        for name in names:
+            function(name)
+    warm = (default_timer() - start) / (len(names) * repeat)
+    return cold, warm
+
+
+def benchmark_loader(project, loader, repeat):
+    """
+    Measure the lookups and the renders of the templates
+    of the project with a loader.
+
+    The app namespace loaders look up the chain templates with an
+    empty namespace and the templates of the last application with
+    its namespace. As it can not resolve the chains, the baseline
+    loader looks up the chain templates and the templates of
+    the last application without namespace.
+
+    The templates of the last application, extending nothing, are
+    rendered with all the loaders, the chains being only rendered
+    with the app namespace loaders.
+    """
+    results = []
+    last_app = project.apps[-1]
+    if loader == BASELINE_LOADER:
+        names = [project.chain_name(i) for i in range(project.templates)]
+        render_names = [project.app_name(last_app, i)
+                        for i in range(project.templates)]
+        names.extend(render_names)
+        chain_names = []
+    else:
+        chain_names = [':%s' % project.chain_name(i)
+                       for i in range(project.templates)]
+        render_names = ['%s:%s' % (last_app, project.app_name(last_app, i))
+                        for i in range(project.templates)]
+        names = chain_names + render_names
+
+    if loader != CACHED_LOADER:
+        template_loader = build_engine(loader).template_loaders[0]
+
+        def get_template_sources(name):
+            return list(template_loader.get_template_sources(name))
+
+        results.append(('get_template_sources', measure(
+            get_template_sources, names, repeat)))
+        results.append(('load_template_source', measure(
+            template_loader.load_template_source, names, repeat)))
+
+    engine = build_engine(loader)
+    templates = dict(
+        (name, engine.from_string(
+            '{%% extends "%s" %%}{%% block content %%}top-level '
+            '{{ block.super }}{%% endblock content %%}' % name))
+        for name in render_names + chain_names)
+    context = Context()
+
+    def render(name):
+        return templates[name].render(context)
+
+    results.append(('render', measure(render, render_names, repeat)))
+    if chain_names:
+        results.append(('render_chain', measure(
+            render, chain_names, repeat)))
+    return [{'loader': loader,
+             'operation': operation,
+             'cold': cold,
+             'warm': warm}
+            for operation, (cold, warm) in results]
+
+
+def run(apps=10, templates=10, depth=3, repeat=100):
+    """
+    Run the benchmark on a synthetic project and return
+    the machine-readable results.
+    """
+    results = []
+    with SyntheticProject(apps, templates, depth) as project:
+        for loader in (BASELINE_LOADER, APP_LOADER, CACHED_LOADER):
+            results.extend(benchmark_loader(project, loader, repeat))
+    return {
+        'parameters': {'apps': apps, 'templates': templates,
+                       'depth': depth, 'repeat': repeat},
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform()},
+        'unit': 'seconds',
+        'results': results}
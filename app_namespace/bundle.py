@@ -0,0 +1,145 @@
+"""Single-file bundle of templates for app-namespace"""
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+from collections import OrderedDict
+
+from app_namespace.index import normalize_template_path
+from app_namespace.index import walk_templates_dir
+from app_namespace.utils import get_mtime_ns
+
+MAGIC = b'APPNSBUNDLE1\n'
+HEADER = struct.Struct('>Q')
+
+
+def get_apps_hash(app_templates_dirs):
+    """
+    Return a hash of the applications and of their
+    'templates' directory, in order.
+    """
+    return hashlib.sha1(json.dumps(
+        list(app_templates_dirs.items())).encode('utf-8')).hexdigest()
+
+
+def get_manifest(app_templates_dirs):
+    """
+    Return the ordered dict of the templates directories with the
+    (template_path, mtime, size) of each template they contain.
+    """
+    manifest = OrderedDict()
+    for templates_dir in app_templates_dirs.values():
+        if templates_dir in manifest:
+            continue
+        manifest[templates_dir] = []
+        for template_path in walk_templates_dir(templates_dir):
+            stat = os.stat(os.path.join(templates_dir, template_path))
+            manifest[templates_dir].append(
+                (template_path, get_mtime_ns(stat), stat.st_size))
+    return manifest
+
+
+def get_manifest_hash(manifest):
+    """
+    Return a hash of a manifest of the templates.
+    """
+    return hashlib.sha1(json.dumps(
+        list(manifest.items())).encode('utf-8')).hexdigest()
+
+
+def write_bundle(path, app_templates_dirs):
+    """
+    Pack all the templates of the applications in a bundle
+    and return the number of templates packed.
+    """
+    manifest = get_manifest(app_templates_dirs)
+    templates = OrderedDict()
+    data = io.BytesIO()
+    count = 0
+    for templates_dir, entries in manifest.items():
+        templates[templates_dir] = {}
+        for template_path, mtime, size in entries:
+            with open(os.path.join(templates_dir, template_path),
+                      'rb') as fp:
+                content = fp.read()
+            templates[templates_dir][template_path] = (
+                data.tell(), len(content))
+            data.write(content)
+            count += 1
+
+    index = json.dumps({
+        'apps_hash': get_apps_hash(app_templates_dirs),
+        'manifest_hash': get_manifest_hash(manifest),
+        'apps': list(app_templates_dirs.items()),
+        'templates': templates}).encode('utf-8')
+
+    temp_path = '%s.tmp' % path
+    with open(temp_path, 'wb') as fp:
+        fp.write(MAGIC)
+        fp.write(HEADER.pack(len(index)))
+        fp.write(index)
+        fp.write(data.getvalue())
+    os.rename(temp_path, path)
+    return count
+
+
+class TemplateBundle(object):
+    """
+    Memory-mapped bundle of templates written by 'write_bundle'.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            if fp.read(len(MAGIC)) != MAGIC:
+                raise ValueError('%s is not a template bundle' % path)
+            index_size = HEADER.unpack(fp.read(HEADER.size))[0]
+            index = json.loads(fp.read(index_size).decode('utf-8'))
+            self.offset = fp.tell()
+            self.data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.apps_hash = index['apps_hash']
+        self.manifest_hash = index['manifest_hash']
+        self.app_templates_dirs = OrderedDict(index['apps'])
+        self.templates = index['templates']
+
+    def __len__(self):
+        return sum(len(templates) for templates in self.templates.values())
+
+    def get_app_templates(self):
+        """
+        Return an ordered dict with the first application referencing
+        each templates directory as keys and the paths of the templates
+        of the directory as values.
+        """
+        indexed_dirs = set()
+        app_templates = OrderedDict()
+        for app, templates_dir in self.app_templates_dirs.items():
+            if templates_dir not in indexed_dirs:
+                indexed_dirs.add(templates_dir)
+                app_templates[app] = list(self.templates[templates_dir])
+        return app_templates
+
+    def exists(self, app, template_path):
+        """
+        Check if a template provided by an application is in the bundle.
+        """
+        try:
+            return normalize_template_path(template_path) in self.templates[
+                self.app_templates_dirs[app]]
+        except KeyError:
+            return False
+
+    def read(self, app, template_path):
+        """
+        Return the content of a template provided by an application,
+        raise KeyError if it is not in the bundle.
+        """
+        offset, size = self.templates[self.app_templates_dirs[app]][
+            normalize_template_path(template_path)]
+        offset += self.offset
+        return self.data[offset:offset + size]
+
+    def close(self):
+        self.data.close()
@@ -0,0 +1,272 @@
+"""Caches for app-namespace"""
+import hashlib
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from app_namespace.utils import get_stat_fingerprint
+from app_namespace.utils import read_file
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+clock = getattr(time, 'monotonic', time.time)
+
+
+class LRUCache(object):
+    """
+    Thread-safe cache keeping at most 'maxsize' entries,
+    evicting the least recently used ones first.
+    Entries older than 'ttl' seconds are expired if provided.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for 'key' or 'default'.
+        """
+        with self._lock:
+            try:
+                value, expires = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < clock():
+                self.misses += 1
+                return default
+            self._entries[key] = (value, expires)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Cache 'value' for 'key', evicting the least recently used
+        entries if the cache is full.
+        """
+        expires = None
+        if self.ttl is not None:
+            expires = clock() + self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """
+        Remove the entry cached for 'key' if present.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Empty the cache, the counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return a snapshot of the counters of the cache.
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize}
+
+
+class SourceCache(object):
+    """
+    Thread-safe cache of the decoded sources of the templates,
+    read through memory maps and bounded by the total size in bytes
+    of the cached sources, evicting the least recently used ones first.
+    A source is invalidated when the inode, the modification time
+    or the size of its file changes, so a hit costs a single stat.
+
+    With 'compress', the sources are kept compressed with zlib
+    and decompressed when requested.
+    """
+
+    def __init__(self, max_bytes, compress=False):
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.resident_bytes = 0
+        self.source_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def read(self, path, encoding, read=None):
+        """
+        Return the decoded source of the file at 'path',
+        calling 'read(path, encoding, stat)' on a miss if provided.
+        """
+        stat = os.stat(path)
+        fingerprint = get_stat_fingerprint(stat)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == fingerprint:
+                del self._entries[path]
+                self._entries[path] = entry
+                self.hits += 1
+                if self.compress:
+                    return zlib.decompress(entry[1]).decode('utf-8')
+                return entry[1]
+            self.misses += 1
+
+        source = (read or read_file)(path, encoding, stat)
+        source_size = sys.getsizeof(source)
+        stored = source
+        if self.compress:
+            stored = zlib.compress(source.encode('utf-8'))
+        size = sys.getsizeof(stored)
+        with self._lock:
+            self._discard(path)
+            if size <= self.max_bytes:
+                self._entries[path] = (fingerprint, stored, size, source_size)
+                self.resident_bytes += size
+                self.source_bytes += source_size
+                while self.resident_bytes > self.max_bytes:
+                    self._remove(self._entries.popitem(last=False)[1])
+                    self.evictions += 1
+        return source
+
+    def _remove(self, entry):
+        self.resident_bytes -= entry[2]
+        self.source_bytes -= entry[3]
+
+    def _discard(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._remove(entry)
+
+    def delete(self, path):
+        """
+        Remove the source cached for 'path' if present.
+        """
+        with self._lock:
+            self._discard(path)
+
+    def clear(self):
+        """
+        Empty the cache, the counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.resident_bytes = 0
+            self.source_bytes = 0
+
+    def stats(self):
+        """
+        Return a snapshot of the counters of the cache.
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'resident_bytes': self.resident_bytes,
+                'source_bytes': self.source_bytes,
+                'compression_ratio': (
+                    self.resident_bytes and
+                    float(self.source_bytes) / self.resident_bytes or 1.0),
+                'max_bytes': self.max_bytes}
+
+
+class SharedSourceCache(object):
+    """
+    Cache of the decoded sources of the templates stored in a backend
+    of the Django cache framework, shared by the processes using it.
+
+    The sources are keyed by the (app, template_path) and the inode,
+    the modification time and the size of their file. When a source
+    is missing, a lock added in the backend lets a single process read
+    the file while the others wait for the source to be stored,
+    at most 'lock_timeout' seconds. The sources expire after 'timeout'
+    seconds, the default timeout of the backend if not provided.
+    """
+    key_prefix = 'app_namespace:source:'
+    poll_interval = 0.05
+
+    def __init__(self, alias, timeout=DEFAULT_TIMEOUT, lock_timeout=10):
+        self.alias = alias
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, key, fingerprint):
+        return self.key_prefix + hashlib.sha1(repr(
+            (key, fingerprint)).encode('utf-8')).hexdigest()
+
+    def read(self, key, path, encoding, stat=None, read=None):
+        """
+        Return the decoded source of the file at 'path' for 'key',
+        calling 'read(path, encoding, stat)' on a miss if provided.
+        """
+        if read is None:
+            read = read_file
+        if stat is None:
+            stat = os.stat(path)
+        cache = self.cache
+        cache_key = self.make_key(key, get_stat_fingerprint(stat))
+        source = cache.get(cache_key)
+        if source is not None:
+            self.hits += 1
+            return source
+        self.misses += 1
+
+        lock_key = cache_key + ':lock'
+        if not cache.add(lock_key, os.getpid(), self.lock_timeout):
+            self.waits += 1
+            deadline = clock() + self.lock_timeout
+            while clock() < deadline:
+                time.sleep(self.poll_interval)
+                source = cache.get(cache_key)
+                if source is not None:
+                    return source
+            return read(path, encoding, stat)
+
+        try:
+            source = read(path, encoding, stat)
+            cache.set(cache_key, source, self.timeout)
+        finally:
+            cache.delete(lock_key)
+        return source
+
+    def stats(self):
+        """
+        Return a snapshot of the counters of the cache.
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits}
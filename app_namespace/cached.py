@@ -0,0 +1,31 @@
+"""Cached template loader for app-namespace"""
+from app_namespace.loader import NamespaceOrigin
+
+from django.template.loaders.cached import Loader as BaseCachedLoader
+
+
+class CachedLoader(BaseCachedLoader):
+    """
+    Cached template loader compatible with the inheritance
+    based on empty namespaces.
+
+    The compiled templates are cached by name and by their position
+    in the chain of overrides, given by the namespace origins
+    already used to extend the template.
+    """
+
+    def cache_key(self, template_name, template_dirs=None, skip=None):
+        """
+        Include the namespace origins already skipped for the
+        template path in the key of a namespaced template.
+        """
+        key = super(CachedLoader, self).cache_key(
+            template_name, template_dirs, skip)
+        if skip and ':' in template_name:
+            template_path = template_name.split(':', 1)[1]
+            matching = [origin.name for origin in skip
+                        if isinstance(origin, NamespaceOrigin) and
+                        origin.template_name == template_path]
+            if matching:
+                key = '-'.join([key, self.generate_hash(matching)])
+        return key
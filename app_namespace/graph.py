@@ -0,0 +1,172 @@
+"""Static graph of the extends and include tags for app-namespace"""
+import re
+from collections import OrderedDict
+
+from app_namespace.index import normalize_template_path
+from app_namespace.watcher import DELETED
+
+EXTENDS = 'extends'
+INCLUDE = 'include'
+
+TAG_RE = re.compile(
+    r'{%\s*(extends|include)\s+(["\'])([^"\']+)\2')
+
+
+def get_references(source):
+    """
+    Return the (tag, template_name) of the extends and include tags
+    of a template source using a literal template name.
+    """
+    return [(tag, template_name) for tag, quote, template_name
+            in TAG_RE.findall(source)]
+
+
+def format_node(node):
+    return '%s:%s' % node
+
+
+class TemplateGraph(object):
+    """
+    Graph of the templates provided by the applications,
+    with the full inheritance chain starting from each of them.
+
+    The nodes are the (app, template_path) of the templates,
+    the chains are resolved like the loader does, an empty namespace
+    extending the first application not already used in the chain.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.template_index = loader.template_index
+        self.references = OrderedDict()
+        self.chains = {}
+        self.cyclic = set()
+        self.build()
+
+    def get_node(self, app, template_path):
+        """
+        Return the node of a template, the application
+        being named like in the index.
+        """
+        return (self.loader.app_aliases.get(app, app),
+                normalize_template_path(template_path))
+
+    def build(self):
+        templates = self.template_index.templates
+        for template_path, apps in sorted(templates.items()):
+            for app in apps:
+                self.references[(app, template_path)] = (
+                    self.read_references(app, template_path))
+        self.resolve_chains()
+
+    def read_references(self, app, template_path):
+        """
+        Return the references of a template, read without
+        going through the instrumentation and the caches.
+        """
+        try:
+            source = self.loader.read_template(app, template_path)
+        except (KeyError, IOError, OSError, UnicodeDecodeError):
+            source = ''
+        return get_references(source)
+
+    def resolve_chains(self):
+        self.cyclic = set()
+        self.chains = dict((node, self.resolve_chain(node))
+                           for node in list(self.references))
+
+    def update(self, app, template_path, event):
+        """
+        Update the graph for a template created, deleted or modified,
+        rereading only its source.
+        """
+        node = (app, normalize_template_path(template_path))
+        if event == DELETED:
+            self.references.pop(node, None)
+        else:
+            self.references[node] = self.read_references(*node)
+        self.resolve_chains()
+
+    def resolve(self, template_name, used):
+        """
+        Return the node loaded for 'template_name' by the loader
+        when the nodes 'used' are skipped, or None if it is not
+        provided by the applications.
+        """
+        if ':' not in template_name:
+            return None
+        app, template_path = template_name.split(':', 1)
+        template_path = normalize_template_path(template_path)
+        apps = self.template_index.get_apps(template_path)
+        if app:
+            node = self.get_node(app, template_path)
+            if node[0] in apps:
+                return node
+            return None
+        for app in self.loader.get_candidate_apps(template_path):
+            if (app, template_path) not in used:
+                return (app, template_path)
+        return None
+
+    def get_extends(self, node):
+        for tag, template_name in self.references.get(node, ()):
+            if tag == EXTENDS:
+                return template_name
+        return None
+
+    def resolve_chain(self, node):
+        """
+        Return the tuple of the nodes extended from 'node',
+        flagging the chains extending a node already used.
+        """
+        chain = [node]
+        used = set(chain)
+        template_name = self.get_extends(node)
+        while template_name is not None:
+            if template_name.startswith(':'):
+                parent = self.resolve(template_name, used)
+            else:
+                parent = self.resolve(template_name, ())
+            if parent is None:
+                break
+            if parent in used:
+                self.cyclic.add(node)
+                break
+            chain.append(parent)
+            used.add(parent)
+            template_name = self.get_extends(parent)
+        return tuple(chain)
+
+    def get_chain(self, app, template_path):
+        """
+        Return the inheritance chain starting from a template,
+        or an empty tuple if it is not in the graph.
+        """
+        return self.chains.get(self.get_node(app, template_path), ())
+
+    def get_includes(self, node):
+        """
+        Return the nodes included by a node.
+        """
+        includes = []
+        for tag, template_name in self.references.get(node, ()):
+            if tag == INCLUDE:
+                include = self.resolve(template_name, ())
+                if include is not None:
+                    includes.append(include)
+        return includes
+
+    def as_dict(self):
+        """
+        Return an exportable dict of the graph.
+        """
+        graph = OrderedDict()
+        for node, chain in self.chains.items():
+            graph[format_node(node)] = {
+                'extends': self.get_extends(node),
+                'includes': [format_node(include)
+                             for include in self.get_includes(node)],
+                'chain': [format_node(parent) for parent in chain],
+                'depth': len(chain),
+                'cyclic': node in self.cyclic}
+        return OrderedDict(sorted(graph.items()))
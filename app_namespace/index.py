@@ -0,0 +1,229 @@
+"""Template index for app-namespace"""
+import json
+import os
+import posixpath
+import sys
+import threading
+import warnings
+import weakref
+from collections import OrderedDict
+
+from app_namespace.utils import get_mtime_ns
+
+intern = getattr(sys, 'intern', lambda string: string)
+
+INDEX_CACHE_VERSION = 1
+
+_shared_indexes = weakref.WeakValueDictionary()
+_shared_indexes_lock = threading.Lock()
+
+
+def normalize_template_path(template_path):
+    """
+    Return the canonical form of a template path used as key
+    in the index, with '/' as separator.
+    """
+    return posixpath.normpath(template_path.replace(os.sep, '/'))
+
+
+def get_template_prefix(template_path):
+    """
+    Return the leading directory of a normalized template path,
+    or an empty string for the templates at the root.
+    """
+    if '/' not in template_path:
+        return ''
+    return template_path.split('/', 1)[0]
+
+
+def walk_templates_dir(templates_dir):
+    """
+    Yield the relative path of every file located
+    under a 'templates' directory.
+    """
+    for root, dirs, files in os.walk(templates_dir, followlinks=True):
+        dirs.sort()
+        for filename in sorted(files):
+            yield normalize_template_path(os.path.relpath(
+                os.path.join(root, filename), templates_dir))
+
+
+def scan_templates_dir(templates_dir):
+    """
+    Return the modification times of the directories located under
+    a 'templates' directory, and the relative paths of its files.
+    """
+    fingerprint = {}
+    template_paths = []
+    for root, dirs, files in os.walk(templates_dir, followlinks=True):
+        dirs.sort()
+        fingerprint[os.path.relpath(root, templates_dir)] = get_mtime_ns(
+            os.stat(root))
+        template_paths.extend(normalize_template_path(os.path.relpath(
+            os.path.join(root, filename), templates_dir))
+            for filename in sorted(files))
+    return fingerprint, template_paths
+
+
+def is_fresh_fingerprint(templates_dir, fingerprint):
+    """
+    Check if the directories of a fingerprint are unchanged,
+    a file added or removed changing the time of its directory.
+    """
+    for directory, mtime in fingerprint.items():
+        try:
+            stat = os.stat(os.path.join(templates_dir, directory))
+        except OSError:
+            return False
+        if get_mtime_ns(stat) != mtime:
+            return False
+    return True
+
+
+class TemplateIndex(object):
+    """
+    Index mapping the relative path of each template provided
+    by the applications to the ordered tuple of the applications
+    really containing it.
+
+    The strings are interned and the entries are tuples replaced
+    on update, so an index built before forking stays shared
+    between the processes.
+    """
+
+    def __init__(self, app_templates):
+        """
+        Build the index from an ordered dict with the applications
+        as keys and the paths of their templates as values.
+        """
+        templates = {}
+        self.positions = {}
+        for position, (app, template_paths) in enumerate(
+                app_templates.items()):
+            app = intern(app)
+            self.positions[app] = position
+            for template_path in template_paths:
+                templates.setdefault(intern(template_path), []).append(app)
+        self.templates = dict((template_path, tuple(apps))
+                              for template_path, apps in templates.items())
+
+    def __len__(self):
+        return len(self.templates)
+
+    def __contains__(self, template_path):
+        return normalize_template_path(template_path) in self.templates
+
+    def get_apps(self, template_path):
+        """
+        Return the ordered tuple of applications providing 'template_path'.
+        """
+        return self.templates.get(normalize_template_path(template_path), ())
+
+    def get_routes(self):
+        """
+        Return the ordered dict of the leading directories of the
+        templates to the ordered tuple of applications providing them.
+        """
+        routes = {}
+        for template_path, apps in self.templates.items():
+            routes.setdefault(get_template_prefix(template_path),
+                              set()).update(apps)
+        return OrderedDict(
+            (prefix, tuple(sorted(apps, key=self.positions.__getitem__)))
+            for prefix, apps in sorted(routes.items()))
+
+    def add(self, app, template_path):
+        """
+        Register 'template_path' as provided by 'app',
+        keeping the order of the applications.
+        """
+        template_path = intern(normalize_template_path(template_path))
+        apps = self.templates.get(template_path, ())
+        if app not in apps:
+            self.templates[template_path] = tuple(sorted(
+                apps + (app,), key=self.positions.__getitem__))
+
+    def remove(self, app, template_path):
+        """
+        Unregister 'template_path' as provided by 'app'.
+        """
+        template_path = normalize_template_path(template_path)
+        apps = tuple(provider for provider in self.templates.get(
+            template_path, ()) if provider != app)
+        if apps:
+            self.templates[template_path] = apps
+        else:
+            self.templates.pop(template_path, None)
+
+
+def get_shared_index(key, build):
+    """
+    Return the index shared by all the loaders of the process for 'key',
+    built with 'build()' if no loader uses it yet.
+    """
+    with _shared_indexes_lock:
+        index = _shared_indexes.get(key)
+        if index is None:
+            index = build()
+            _shared_indexes[key] = index
+    return index
+
+
+def load_index_cache(path):
+    """
+    Load a cache file of template indexes, ignoring it if unusable.
+    """
+    try:
+        with open(path) as fp:
+            cache = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return {}
+    if cache.get('version') != INDEX_CACHE_VERSION:
+        return {}
+    return cache
+
+
+def save_index_cache(path, cache):
+    """
+    Save atomically a cache file of template indexes.
+    """
+    temp_path = '%s.%s.tmp' % (path, os.getpid())
+    try:
+        with open(temp_path, 'w') as fp:
+            json.dump(cache, fp)
+        os.rename(temp_path, path)
+    except (IOError, OSError) as error:
+        warnings.warn('Template index cache %s can not be saved: %s' % (
+            path, error))
+
+
+def build_cached_index(path, app_templates_dirs):
+    """
+    Build the index of the templates from the cache file at 'path',
+    rescanning only the 'templates' directories whose fingerprint
+    has changed, and update the cache file if needed.
+    """
+    cache = load_index_cache(path)
+    cached_dirs = cache.get('dirs', {})
+    apps = [[app, templates_dir]
+            for app, templates_dir in app_templates_dirs.items()]
+    changed = cache.get('apps') != apps
+
+    dirs = {}
+    app_templates = OrderedDict()
+    for app, templates_dir in app_templates_dirs.items():
+        entry = cached_dirs.get(templates_dir)
+        if entry is None or not is_fresh_fingerprint(
+                templates_dir, entry['fingerprint']):
+            fingerprint, template_paths = scan_templates_dir(templates_dir)
+            entry = {'fingerprint': fingerprint,
+                     'templates': template_paths}
+            changed = True
+        dirs[templates_dir] = entry
+        app_templates[app] = entry['templates']
+
+    if changed:
+        save_index_cache(path, {'version': INDEX_CACHE_VERSION,
+                                'apps': apps,
+                                'dirs': dirs})
+    return TemplateIndex(app_templates)
@@ -1,11 +1,36 @@
 """Template loader for app-namespace"""
 import errno
+import functools
 import io
 import os
+import threading
+import warnings
 from collections import OrderedDict
 
+from app_namespace.bundle import TemplateBundle
+from app_namespace.bundle import get_apps_hash
+from app_namespace.cache import LRUCache
+from app_namespace.cache import SharedSourceCache
+from app_namespace.cache import SourceCache
+from app_namespace.graph import TemplateGraph
+from app_namespace.index import TemplateIndex
+from app_namespace.index import build_cached_index
+from app_namespace.index import get_shared_index
+from app_namespace.index import get_template_prefix
+from app_namespace.index import normalize_template_path
+from app_namespace.index import walk_templates_dir
+from app_namespace.stats import LoaderStats
+from app_namespace.utils import decode_source
+from app_namespace.utils import read_file
+from app_namespace.utils import read_mmap
+from app_namespace.watcher import CREATED
+from app_namespace.watcher import DELETED
+from app_namespace.watcher import get_watcher
+
 import django
 from django.apps import apps
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
 try:
     from django.template import Origin
 except ImportError:  # pragma: no cover
@@ -13,14 +38,34 @@ except ImportError:  # pragma: no cover
         def __init__(self, **kwargs):
             for k, v in kwargs.items():
                 setattr(self, k, v)
+from django.template import Template
 from django.template import TemplateDoesNotExist
 from django.template.loaders.base import Loader as BaseLoader
 from django.utils._os import safe_join
 from django.utils._os import upath
 from django.utils.functional import cached_property
 
+PASSTHROUGH = object()
+
+
+def get_templates_dir(app_config):
+    """
+    Return the 'templates' directory of an application
+    or None if it does not have one.
+    """
+    templates_dir = os.path.join(
+        getattr(app_config, 'path', '/'), 'templates')
+    if os.path.isdir(templates_dir):
+        return upath(templates_dir)
+    return None
+
 
 class NamespaceOrigin(Origin):
+    """
+    Origin of a template provided by an application,
+    pooled by the loader for each (app, template_name)
+    rather than slotted, Django's Origin having a __dict__.
+    """
 
     def __init__(self, app_name, *args, **kwargs):
         self.app_name = app_name
@@ -33,25 +78,144 @@ class Loader(BaseLoader):
     a template provided by an app at the same time.
     """
     is_usable = True
+    origins_pool_size = 10000
 
     def __init__(self, *args, **kwargs):
         super(Loader, self).__init__(*args, **kwargs)
-        self._already_used = []
+        self._local = threading.local()
+        self._refresh_lock = threading.RLock()
+        self._template_index = None
+        self._template_graph = None
+        self._routes = None
+        self._app_configs = None
+        self._app_templates_dir_cache = {}
+        self._config_templates_dirs = {}
+        self._dir_templates = {}
+        self._origins = {}
+        self._template_paths = {}
+        self.negative_cache = None
+        negative_cache_size = getattr(
+            settings, 'APP_NAMESPACE_NEGATIVE_CACHE_SIZE', 0)
+        if negative_cache_size:
+            self.negative_cache = LRUCache(
+                negative_cache_size,
+                getattr(settings, 'APP_NAMESPACE_NEGATIVE_CACHE_TTL', None))
+        self.source_cache = None
+        source_cache_size = getattr(
+            settings, 'APP_NAMESPACE_SOURCE_CACHE_SIZE', 0)
+        if source_cache_size:
+            self.source_cache = SourceCache(
+                source_cache_size,
+                getattr(settings, 'APP_NAMESPACE_SOURCE_CACHE_COMPRESS',
+                        False))
+        self.shared_cache = None
+        shared_cache_alias = getattr(
+            settings, 'APP_NAMESPACE_SHARED_CACHE', None)
+        if shared_cache_alias:
+            self.shared_cache = SharedSourceCache(
+                shared_cache_alias,
+                getattr(settings, 'APP_NAMESPACE_SHARED_CACHE_TIMEOUT',
+                        DEFAULT_TIMEOUT))
+        self.stats = None
+        if getattr(settings, 'APP_NAMESPACE_INSTRUMENTATION', False):
+            self.stats = LoaderStats(self)
+        self.bundle_path = getattr(settings, 'APP_NAMESPACE_BUNDLE', None)
+        self.index_cache_path = getattr(
+            settings, 'APP_NAMESPACE_INDEX_CACHE', None)
+        self.graph = getattr(settings, 'APP_NAMESPACE_GRAPH', False)
+        self.routes = getattr(settings, 'APP_NAMESPACE_ROUTES', None)
+        self.watch = getattr(settings, 'APP_NAMESPACE_WATCH', settings.DEBUG)
+        self.watcher = None
+        self._watched_dirs = {}
+
+    @property
+    def _already_used(self):
+        """
+        Set of the (app, template_path) already used by the current thread.
+        """
+        try:
+            return self._local.already_used
+        except AttributeError:
+            self._local.already_used = set()
+            return self._local.already_used
 
     def reset(self, mandatory_on_django_18):
         """
-        Empty the cache of paths already used.
+        Empty the cache of templates already used by the current thread.
         """
         if django.VERSION[1] == 8:
             if not mandatory_on_django_18:
                 return
-        self._already_used = []
+        self._local.already_used = set()
 
     def get_app_template_path(self, app, template_name):
         """
-        Return the full path of a template name located in an app.
+        Return the full path of a template name located in an app,
+        memoized until the registry of the applications changes.
+        """
+        key = (app, template_name)
+        try:
+            return self._template_paths[key]
+        except KeyError:
+            pass
+        path = safe_join(self.get_app_templates_dir(app), template_name)
+        if len(self._template_paths) >= self.origins_pool_size:
+            self._template_paths = {}
+        self._template_paths[key] = path
+        return path
+
+    def get_app_templates_dir(self, app):
+        """
+        Return the 'templates' directory of an application by name
+        or label, resolved on demand and memoized when the whole
+        'app_templates_dirs' is not built yet.
+        Raise KeyError if the application has no 'templates' directory.
         """
-        return safe_join(self.app_templates_dirs[app], template_name)
+        app_templates_dirs = self.__dict__.get('app_templates_dirs')
+        if app_templates_dirs is not None:
+            return app_templates_dirs[app]
+        try:
+            templates_dir = self._app_templates_dir_cache[app]
+        except KeyError:
+            templates_dir = None
+            app_config = apps.app_configs.get(app)
+            if app_config is None:
+                for app_config in apps.get_app_configs():
+                    if app_config.name == app:
+                        break
+                else:
+                    app_config = None
+            if app_config is not None:
+                templates_dir = self.get_config_templates_dir(app_config)
+            self._app_templates_dir_cache[app] = templates_dir
+        if templates_dir is None:
+            raise KeyError(app)
+        return templates_dir
+
+    def get_config_templates_dir(self, app_config):
+        """
+        Return the 'templates' directory of an application config,
+        memoized by path to be kept when the registry changes.
+        """
+        path = getattr(app_config, 'path', None)
+        try:
+            return self._config_templates_dirs[path]
+        except KeyError:
+            templates_dir = self._config_templates_dirs[path] = (
+                get_templates_dir(app_config))
+            return templates_dir
+
+    def get_dir_templates(self, templates_dir):
+        """
+        Return the paths of the templates of a 'templates' directory,
+        memoized to be kept when the registry changes.
+        """
+        try:
+            return self._dir_templates[templates_dir]
+        except KeyError:
+            template_paths = self._dir_templates[templates_dir] = list(
+                walk_templates_dir(templates_dir))
+            return template_paths
 
     @cached_property
     def app_templates_dirs(self):
@@ -61,30 +225,334 @@ class Loader(BaseLoader):
         """
         app_templates_dirs = OrderedDict()
         for app_config in apps.get_app_configs():
-            templates_dir = os.path.join(
-                getattr(app_config, 'path', '/'), 'templates')
-            if os.path.isdir(templates_dir):
-                templates_dir = upath(templates_dir)
+            templates_dir = self.get_config_templates_dir(app_config)
+            if templates_dir is not None:
                 app_templates_dirs[app_config.name] = templates_dir
                 app_templates_dirs[app_config.label] = templates_dir
         return app_templates_dirs
 
+    @cached_property
+    def app_aliases(self):
+        """
+        Build a cached dict with the names and the labels of the
+        applications as keys and the first application referencing
+        the same 'templates' directory as values.
+        """
+        app_aliases = {}
+        canonical_apps = {}
+        for app, templates_dir in self.app_templates_dirs.items():
+            app_aliases[app] = canonical_apps.setdefault(templates_dir, app)
+        return app_aliases
+
+    @cached_property
+    def templates_dirs(self):
+        """
+        Build a cached dict with one entry per 'templates' directory,
+        keyed by the canonical application referencing it.
+        """
+        return OrderedDict(
+            (app, templates_dir)
+            for app, templates_dir in self.app_templates_dirs.items()
+            if self.app_aliases[app] == app)
+
+    @cached_property
+    def bundle(self):
+        """
+        Bundle of templates used instead of the files if configured
+        and built for the current applications.
+        """
+        if not self.bundle_path:
+            return None
+        try:
+            bundle = TemplateBundle(self.bundle_path)
+        except (IOError, ValueError) as error:
+            warnings.warn('Template bundle %s can not be used: %s' % (
+                self.bundle_path, error))
+            return None
+        if bundle.apps_hash != get_apps_hash(self.app_templates_dirs):
+            warnings.warn('Template bundle %s is stale, rebuild it with '
+                          'the app_namespace_bundle command' %
+                          self.bundle_path)
+            bundle.close()
+            return None
+        return bundle
+
+    def refresh(self):
+        """
+        Update the tables built from the registry of the applications
+        if it has changed since they were built. The 'templates'
+        directories and the templates of the applications kept
+        are reused, only the applications added are scanned.
+        """
+        if self._app_configs is apps.app_configs:
+            return
+        with self._refresh_lock:
+            app_configs = apps.app_configs
+            if self._app_configs is app_configs:
+                return
+            previous_dirs = self.__dict__.get(
+                'app_templates_dirs', self._app_templates_dir_cache)
+            for table in ('app_templates_dirs', 'app_aliases',
+                          'templates_dirs'):
+                self.__dict__.pop(table, None)
+            bundle = self.__dict__.pop('bundle', None)
+            if bundle is not None:
+                bundle.close()
+            self._app_templates_dir_cache = {}
+            template_paths = self._template_paths
+            self._template_paths = {}
+            for (app, template_name), path in template_paths.items():
+                try:
+                    templates_dir = self.get_app_templates_dir(app)
+                except KeyError:
+                    continue
+                if templates_dir == previous_dirs.get(app):
+                    self._template_paths[(app, template_name)] = path
+            self._template_index = None
+            self._template_graph = None
+            self._routes = None
+            if self.negative_cache is not None:
+                self.negative_cache.clear()
+            if self.watcher is not None:
+                self.watcher.stop()
+                self.watcher = None
+            self._app_configs = app_configs
+
+    @property
+    def template_index(self):
+        """
+        Index of the templates provided by the applications,
+        rebuilt if the registry of the applications has changed.
+        The index is shared by the loaders of the process using
+        the same templates directories, unless they are watched.
+        """
+        self.refresh()
+        template_index = self._template_index
+        if template_index is None:
+            with self._refresh_lock:
+                template_index = self._template_index
+                if template_index is None:
+                    template_index = self.build_shared_index()
+                    self._template_index = template_index
+                    if self.watch and self.bundle is None:
+                        self.start_watcher()
+        return template_index
+
+    def build_shared_index(self):
+        """
+        Build the index of the templates from the bundle, or from the
+        index cache or by walking the templates directories, shared
+        unless they are watched, the watcher updating the index.
+        """
+        bundle = self.bundle
+        if bundle is not None:
+            return get_shared_index(
+                (bundle.path, bundle.apps_hash, bundle.manifest_hash),
+                lambda: TemplateIndex(bundle.get_app_templates()))
+        templates_dirs = self.templates_dirs
+        if self.watch:
+            return self.build_template_index(templates_dirs)
+        return get_shared_index(
+            tuple(templates_dirs.items()),
+            lambda: self.build_template_index(templates_dirs))
+
+    @property
+    def template_graph(self):
+        """
+        Graph of the extends and include tags of the templates
+        provided by the applications, built on first use, which
+        'build_indexes' and the warm-up do before serving.
+        """
+        self.refresh()
+        template_graph = self._template_graph
+        if template_graph is None:
+            template_graph = self._template_graph = TemplateGraph(self)
+        return template_graph
+
+    @property
+    def routing_table(self):
+        """
+        Ordered dict of the leading directories of the templates to the
+        applications searched for them with an empty namespace,
+        restricted by the APP_NAMESPACE_ROUTES setting.
+        """
+        routing_table = self.template_index.get_routes()
+        for prefix, providers in routing_table.items():
+            routing_table[prefix] = self.route_apps(prefix, providers)
+        return routing_table
+
+    def route_apps(self, prefix, providers):
+        """
+        Filter the applications providing a template with
+        the routes of the leading directory of its path.
+        """
+        if not self.routes:
+            return providers
+        if self._routes is None:
+            app_aliases = self.app_aliases
+            self._routes = dict(
+                (prefix, frozenset(app_aliases.get(app, app)
+                                   for app in route))
+                for prefix, route in self.routes.items())
+        routes = self._routes.get(prefix)
+        if routes is None:
+            return providers
+        return tuple(app for app in providers if app in routes)
+
+    def get_candidate_apps(self, template_path):
+        """
+        Return the ordered tuple of applications searched
+        for 'template_path' with an empty namespace.
+        """
+        candidates = self.template_index.get_apps(template_path)
+        if self.routes and candidates:
+            candidates = self.route_apps(get_template_prefix(
+                normalize_template_path(template_path)), candidates)
+        return candidates
+
+    def build_template_index(self, templates_dirs):
+        """
+        Build the index of the templates from the index cache file
+        if configured, otherwise by walking the templates directories.
+        """
+        if self.index_cache_path:
+            return build_cached_index(self.index_cache_path, templates_dirs)
+        return self.scan_templates_dirs(templates_dirs)
+
+    def scan_templates_dirs(self, templates_dirs):
+        """
+        Build the index of the templates by walking the templates
+        directories not already walked by the loader.
+        """
+        return TemplateIndex(OrderedDict(
+            (app, self.get_dir_templates(templates_dir))
+            for app, templates_dir in templates_dirs.items()))
+
+    def start_watcher(self):
+        """
+        Start watching the templates directories of the applications
+        to update the caches of the loader incrementally.
+        """
+        self._watched_dirs = OrderedDict()
+        for app, templates_dir in self.app_templates_dirs.items():
+            self._watched_dirs.setdefault(templates_dir, []).append(app)
+        self.watcher = get_watcher(
+            self._watched_dirs, self,
+            getattr(settings, 'APP_NAMESPACE_WATCH_INTERVAL', None))
+
+    def template_changed(self, templates_dir, template_path, event):
+        """
+        Update the caches of the loader for a template created,
+        deleted or modified in a watched templates directory.
+        """
+        template_index = self._template_index
+        if template_index is None:
+            return
+        self._dir_templates.pop(templates_dir, None)
+        aliases = self._watched_dirs.get(templates_dir, [])
+        if not aliases:
+            return
+        if event == CREATED:
+            template_index.add(aliases[0], template_path)
+            if self.negative_cache is not None:
+                for app in aliases:
+                    self.negative_cache.delete((app, template_path))
+        elif event == DELETED:
+            template_index.remove(aliases[0], template_path)
+        if event == DELETED and self.source_cache is not None:
+            self.source_cache.delete(
+                os.path.join(templates_dir, template_path))
+        template_graph = self._template_graph
+        if template_graph is not None:
+            template_graph.update(aliases[0], template_path, event)
+
     def get_contents(self, origin):
         """
         Try to load the origin.
         """
+        if self.stats is not None:
+            return self.stats.track_contents(self.read_contents, origin)
+        return self.read_contents(origin)
+
+    def read_contents(self, origin):
+        """
+        Read the source of the origin from the bundle of templates
+        or from the templates directory of its application.
+        """
+        if self.bundle is not None:
+            return self.get_bundle_contents(origin)
         try:
             path = self.get_app_template_path(
                 origin.app_name, origin.template_name)
-            with io.open(path, encoding=self.engine.file_charset) as fp:
-                return fp.read()
+            read = self.read_source
+            if self.shared_cache is not None:
+                read = functools.partial(
+                    self.shared_cache.read,
+                    (origin.app_name, origin.template_name),
+                    read=self.read_source)
+            if self.source_cache is not None:
+                return self.source_cache.read(
+                    path, self.engine.file_charset, read)
+            return read(path, self.engine.file_charset)
         except KeyError:
+            self.cache_miss(origin)
             raise TemplateDoesNotExist(origin)
-        except IOError as error:
+        except (IOError, OSError) as error:
             if error.errno == errno.ENOENT:
+                self.cache_miss(origin)
                 raise TemplateDoesNotExist(origin)
             raise
 
+    def read_source(self, path, encoding, stat=None):
+        """
+        Open and decode the file of a template, counting
+        the opens and the bytes read when instrumented.
+        """
+        if stat is not None:
+            size = stat.st_size
+            source = read_mmap(path, size, encoding)
+        else:
+            with io.open(path, 'rb') as fp:
+                data = fp.read()
+            size = len(data)
+            source = decode_source(data, encoding)
+        if self.stats is not None:
+            self.stats.track_open(size)
+        return source
+
+    def read_template(self, app, template_path):
+        """
+        Read the source of a template provided by an application,
+        outside of the instrumentation and of the caches.
+        """
+        encoding = self.engine.file_charset
+        if self.bundle is not None:
+            return decode_source(
+                self.bundle.read(app, template_path), encoding)
+        path = self.get_app_template_path(app, template_path)
+        return read_file(path, encoding, os.stat(path))
+
+    def get_bundle_contents(self, origin):
+        """
+        Load the origin from the bundle of templates.
+        """
+        try:
+            return decode_source(self.bundle.read(
+                origin.app_name, origin.template_name),
+                self.engine.file_charset)
+        except KeyError:
+            self.cache_miss(origin)
+            raise TemplateDoesNotExist(origin)
+
+    def cache_miss(self, origin):
+        """
+        Remember that the origin does not exist
+        if the negative cache is enabled.
+        """
+        if self.negative_cache is not None:
+            self.negative_cache.set(
+                (origin.app_name, origin.template_name), True)
+
     def get_template_sources(self, template_name):
         """
         Build a list of Origin to load 'template_name' splitted with ':'.
@@ -92,30 +560,180 @@ class Loader(BaseLoader):
         is the true value of 'template_name' provided by the specified
         application.
         """
+        if self.stats is not None:
+            return self.stats.track_sources(
+                template_name, self.iter_template_sources(template_name))
+        return self.iter_template_sources(template_name)
+
+    def iter_template_sources(self, template_name):
+        """
+        Yield the origins to load 'template_name'.
+        """
         if ':' not in template_name:
             self.reset(True)
             return
 
+        self.refresh()
         app, template_path = template_name.split(':')
         if app:
-            yield NamespaceOrigin(
-                app_name=app,
-                name='app_namespace:%s:%s' % (app, template_name),
-                template_name=template_path,
-                loader=self)
+            if (self.negative_cache is not None and
+                    (app, template_path) in self.negative_cache):
+                return
+            yield self.get_origin(app, template_name, template_path)
             return
 
         self.reset(False)
-        for app in self.app_templates_dirs:
-            file_path = self.get_app_template_path(app, template_path)
-            if file_path in self._already_used:
+        already_used = self._already_used
+        for app in self.get_candidate_apps(template_path):
+            if (app, template_path) in already_used:
                 continue
-            self._already_used.append(file_path)
-            yield NamespaceOrigin(
+            already_used.add((app, template_path))
+            yield self.get_origin(app, template_name, template_path)
+
+    def select_template_origin(self, template_names):
+        """
+        Return the origin of the first template existing among
+        'template_names', or None, answering all the candidates
+        from the template index without raising for the misses.
+        PASSTHROUGH is returned on the first name without namespace,
+        left to the other loaders like 'select_template' would do.
+        """
+        template_index = self.template_index
+        app_aliases = self.app_aliases
+        for template_name in template_names:
+            if ':' not in template_name:
+                return PASSTHROUGH
+            app, template_path = template_name.split(':')
+            if not app:
+                candidates = self.get_candidate_apps(template_path)
+                if candidates:
+                    return self.get_origin(
+                        candidates[0], template_name, template_path)
+            elif app_aliases.get(app) in template_index.get_apps(
+                    template_path):
+                return self.get_origin(app, template_name, template_path)
+        return None
+
+    def get_template(self, template_name, template_dirs=None, skip=None):
+        """
+        Load the next template of an inheritance chain in one step
+        from the template graph if enabled, Django >= 1.9 providing
+        the templates already used in the chain with 'skip'.
+        """
+        if self.graph and skip and template_name.startswith(':'):
+            template = self.get_chained_template(template_name, skip)
+            if template is not None:
+                return template
+        return super(Loader, self).get_template(
+            template_name, template_dirs, skip)
+
+    def get_chained_template(self, template_name, skip):
+        """
+        Return the template extended with an empty namespace at the end
+        of the chain 'skip', if the chain was precomputed in the graph.
+        Django skipping the origins by name, the chains using a template
+        loaded with an explicit application are left to Django, like
+        all the chains until the graph is built outside of the requests.
+        """
+        self.refresh()
+        graph = self._template_graph
+        if graph is None:
+            return None
+        used = [origin for origin in skip
+                if isinstance(origin, NamespaceOrigin) and
+                origin.loader is self]
+        if not used:
+            return None
+        for origin in used:
+            if origin.name != 'app_namespace:%s::%s' % (
+                    origin.app_name, origin.template_name):
+                return None
+        chain = graph.get_chain(used[0].app_name, used[0].template_name)
+        if len(chain) <= len(used):
+            return None
+        for node, origin in zip(chain, used):
+            if node != graph.get_node(origin.app_name, origin.template_name):
+                return None
+        app, template_path = chain[len(used)]
+        if graph.get_node(app, template_name[1:]) != chain[len(used)]:
+            return None
+        origin = self.get_origin(app, template_name, template_name[1:])
+        try:
+            contents = self.get_contents(origin)
+        except TemplateDoesNotExist:
+            return None
+        return Template(contents, origin, origin.template_name, self.engine)
+
+    def get_origin(self, app, template_name, template_path):
+        """
+        Return the origin of 'template_path' provided by 'app' to load
+        'template_name', reusing the origins already built.
+        """
+        key = (app, template_name)
+        origin = self._origins.get(key)
+        if origin is None:
+            if len(self._origins) >= self.origins_pool_size:
+                self._origins = {}
+            origin = self._origins[key] = NamespaceOrigin(
                 app_name=app,
                 name='app_namespace:%s:%s' % (app, template_name),
                 template_name=template_path,
                 loader=self)
+        return origin
+
+    @cached_property
+    def executor(self):
+        """
+        Bounded executor running the file operations of the
+        asynchronous methods, shared by the loaders of the process.
+        """
+        from app_namespace.aio import get_executor
+        return get_executor(
+            getattr(settings, 'APP_NAMESPACE_ASYNC_WORKERS', 4))
+
+    def origin_exists(self, origin):
+        """
+        Check if the source of the origin exists.
+        """
+        if self.bundle is not None:
+            return self.bundle.exists(origin.app_name, origin.template_name)
+        try:
+            return os.path.isfile(self.get_app_template_path(
+                origin.app_name, origin.template_name))
+        except KeyError:
+            return False
+
+    def aget_template_sources(self, template_name, loop=None):
+        """
+        Asynchronous counterpart of 'get_template_sources', returning
+        a future of the list of the origins really existing.
+        The candidates are resolved and probed concurrently
+        in the executor of the loader. Requires Python >= 3.4.
+        """
+        from app_namespace.aio import get_loop
+        from app_namespace.aio import map_in_executor
+        from app_namespace.aio import then
+        loop = get_loop(loop)
+
+        def probe(origins):
+            return then(loop, map_in_executor(
+                loop, self.executor, self.origin_exists, origins),
+                lambda exists: [origin for origin, exist in
+                                zip(origins, exists) if exist])
+
+        return then(loop, loop.run_in_executor(
+            self.executor, list, self.get_template_sources(template_name)),
+            probe)
+
+    def aget_contents(self, origin, loop=None):
+        """
+        Asynchronous counterpart of 'get_contents', returning a future
+        of the source of the origin read in the executor of the loader.
+        Requires Python >= 3.4.
+        """
+        from app_namespace.aio import get_loop
+        return get_loop(loop).run_in_executor(
+            self.executor, self.get_contents, origin)
 
     def load_template_source(self, *ka):
         """
@@ -0,0 +1 @@
+"""Management of app_namespace"""
@@ -0,0 +1 @@
+"""Commands of app_namespace"""
@@ -0,0 +1,42 @@
+"""Command for benchmarking the app namespace template loader"""
+import json
+
+from app_namespace.benchmark import run
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the app namespace template loaders against the
+    app directories template loader on a synthetic project.
+    """
+    help = 'Benchmark the app namespace template loader.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--apps', type=int, dest='apps', default=10,
+            help='Number of applications in the synthetic project.')
+        parser.add_argument(
+            '--templates', type=int, dest='templates', default=10,
+            help='Number of templates in each application.')
+        parser.add_argument(
+            '--depth', type=int, dest='depth', default=3,
+            help='Depth of the chains of empty namespaces.')
+        parser.add_argument(
+            '--repeat', type=int, dest='repeat', default=100,
+            help='Number of warm lookups and renders of each template.')
+        parser.add_argument(
+            '--output', dest='output', default=None,
+            help='Write the JSON results in this file '
+                 'instead of the standard output.')
+
+    def handle(self, *args, **options):
+        results = run(options['apps'], options['templates'],
+                      options['depth'], options['repeat'])
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                fp.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,52 @@
+"""Command for packing the templates of the applications in a bundle"""
+from app_namespace.bundle import TemplateBundle
+from app_namespace.bundle import get_apps_hash
+from app_namespace.bundle import get_manifest
+from app_namespace.bundle import get_manifest_hash
+from app_namespace.bundle import write_bundle
+from app_namespace.loader import Loader
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.template.engine import Engine
+
+
+class Command(BaseCommand):
+    """
+    Pack every template provided by the applications
+    in a single indexed file, or check if it is stale.
+    """
+    help = 'Pack the templates of the applications in a bundle.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=getattr(settings, 'APP_NAMESPACE_BUNDLE', None),
+            help='Path of the bundle, defaults to APP_NAMESPACE_BUNDLE.')
+        parser.add_argument(
+            '--check', action='store_true', dest='check', default=False,
+            help='Check if the bundle is up to date instead of building it.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError('No path provided for the bundle '
+                               'and APP_NAMESPACE_BUNDLE is not set.')
+        app_templates_dirs = Loader(Engine()).app_templates_dirs
+
+        if options['check']:
+            try:
+                bundle = TemplateBundle(path)
+            except (IOError, ValueError) as error:
+                raise CommandError(str(error))
+            bundle.close()
+            if (bundle.apps_hash != get_apps_hash(app_templates_dirs) or
+                    bundle.manifest_hash != get_manifest_hash(
+                        get_manifest(app_templates_dirs))):
+                raise CommandError('Template bundle %s is stale.' % path)
+            self.stdout.write('Template bundle %s is up to date.' % path)
+            return
+
+        count = write_bundle(path, app_templates_dirs)
+        self.stdout.write('%s templates packed in %s.' % (count, path))
@@ -0,0 +1,44 @@
+"""Command for exporting the graph of the namespaced templates"""
+import json
+
+from app_namespace.graph import TemplateGraph
+from app_namespace.loader import Loader
+
+from django.core.management.base import BaseCommand
+from django.template.engine import Engine
+
+
+class Command(BaseCommand):
+    """
+    Precompute the inheritance chains of the templates provided
+    by the applications and report the deep or cyclic ones.
+    """
+    help = 'Export the extends and include graph of the templates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-depth', type=int, dest='max_depth', default=5,
+            help='Report the chains deeper than this depth.')
+        parser.add_argument(
+            '--output', dest='output', default=None,
+            help='Write the graph as JSON in this file.')
+
+    def handle(self, *args, **options):
+        graph = TemplateGraph(Loader(Engine())).as_dict()
+
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                json.dump(graph, fp, indent=2)
+
+        deep = cyclic = 0
+        for template_name, node in graph.items():
+            if node['cyclic']:
+                cyclic += 1
+                self.stdout.write('Cyclic chain: %s' % ' -> '.join(
+                    node['chain']))
+            elif node['depth'] > options['max_depth']:
+                deep += 1
+                self.stdout.write('Deep chain (%s): %s' % (
+                    node['depth'], ' -> '.join(node['chain'])))
+        self.stdout.write('%s templates, %s deep chains, '
+                          '%s cyclic chains.' % (len(graph), deep, cyclic))
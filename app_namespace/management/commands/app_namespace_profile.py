@@ -0,0 +1,33 @@
+"""Command for profiling the app namespace template loader"""
+from app_namespace.profiling import profile
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Render templates with a cold app namespace loader,
+    report the time spent in each phase and write the profile.
+    """
+    help = 'Profile the cold start of the app namespace template loader.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'template_names', nargs='+',
+            help='Names of the templates to render.')
+        parser.add_argument(
+            '--output', dest='output', default='app_namespace',
+            help='Prefix of the .prof and .folded files written.')
+
+    def handle(self, *args, **options):
+        timings, errors = profile(options['template_names'],
+                                  options['output'])
+        for template_name, error in errors:
+            self.stdout.write('Error rendering %s: %r' % (
+                template_name, error))
+        for phase, duration in timings.items():
+            self.stdout.write('%8.2f ms  %s' % (duration * 1000, phase))
+        self.stdout.write('%8.2f ms  total' % (
+            sum(timings.values()) * 1000))
+        self.stdout.write('Profile written in %(output)s.prof and '
+                          'collapsed stacks in %(output)s.folded.' % options)
@@ -0,0 +1,17 @@
+"""Command for displaying the routing table of the empty namespaces"""
+from app_namespace.loader import Loader
+
+from django.core.management.base import BaseCommand
+from django.template.engine import Engine
+
+
+class Command(BaseCommand):
+    """
+    Display the applications searched with an empty namespace
+    for each leading directory of the templates.
+    """
+    help = 'Display the routing table of the app namespace loader.'
+
+    def handle(self, *args, **options):
+        for prefix, apps in Loader(Engine()).routing_table.items():
+            self.stdout.write('%s/: %s' % (prefix, ', '.join(apps)))
@@ -0,0 +1,63 @@
+"""Command for stress testing the app namespace template loader"""
+import json
+
+from app_namespace.stress import run
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+
+class Command(BaseCommand):
+    """
+    Render deep chains of empty namespaces from a growing number
+    of threads, and optionally of processes, checking the renders
+    against the single-threaded ones.
+    """
+    help = 'Stress test the app namespace template loader.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--apps', type=int, dest='apps', default=10,
+            help='Number of applications in the synthetic project.')
+        parser.add_argument(
+            '--templates', type=int, dest='templates', default=10,
+            help='Number of templates in each application.')
+        parser.add_argument(
+            '--depth', type=int, dest='depth', default=5,
+            help='Depth of the chains of empty namespaces.')
+        parser.add_argument(
+            '--workers', dest='workers', default='1,2,4,8',
+            help='Comma separated numbers of concurrent workers.')
+        parser.add_argument(
+            '--iterations', type=int, dest='iterations', default=10,
+            help='Number of renders of each template by each worker.')
+        parser.add_argument(
+            '--processes', action='store_true', dest='processes',
+            default=False,
+            help='Also render the templates from a pool of processes.')
+        parser.add_argument(
+            '--output', dest='output', default=None,
+            help='Write the JSON results in this file '
+                 'instead of the standard output.')
+
+    def handle(self, *args, **options):
+        try:
+            workers = [int(count) for count in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('Invalid numbers of workers: %s' %
+                               options['workers'])
+        results = run(options['apps'], options['templates'],
+                      options['depth'], workers, options['iterations'],
+                      options['processes'])
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                fp.write(output)
+        else:
+            self.stdout.write(output)
+
+        mismatches = [result for result in results['results']
+                      if result['mismatches']]
+        if mismatches:
+            raise CommandError('%s runs rendered templates differently '
+                               'than a single thread.' % len(mismatches))
@@ -0,0 +1,36 @@
+"""Command for warming up the app namespace template loaders"""
+import time
+
+from app_namespace.warmup import warmup
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Resolve and compile every namespaced template
+    and report the time spent on each of them.
+    """
+    help = 'Warm up the caches of the app namespace template loaders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, dest='concurrency', default=4,
+            help='Number of threads loading the templates.')
+
+    def handle(self, *args, **options):
+        start = time.time()
+        results = warmup(concurrency=options['concurrency'])
+        duration = time.time() - start
+
+        errors = 0
+        for template_name, template_duration, error in sorted(
+                results, key=lambda result: -result[1]):
+            if error is not None:
+                errors += 1
+            if options['verbosity'] > 1 or error is not None:
+                self.stdout.write('%8.2f ms  %s%s' % (
+                    template_duration * 1000, template_name,
+                    error is not None and '  (%r)' % error or ''))
+        self.stdout.write('%s templates warmed up in %.2f ms, %s errors.' % (
+            len(results), duration * 1000, errors))
@@ -0,0 +1,163 @@
+"""Profiling of the cold start of the app namespace template loader"""
+import cProfile
+import pstats
+from collections import OrderedDict
+from timeit import default_timer
+
+from django.template import Context
+from django.template.base import Template
+from django.template.engine import Engine
+from django.test.utils import override_settings
+
+PHASES = ('registry', 'index', 'lookup', 'read', 'parse', 'render')
+
+
+class ParseTimer(object):
+    """
+    Context manager timing the compilation of the templates.
+    """
+
+    def __init__(self):
+        self.duration = 0.0
+        self.compile_nodelist = None
+
+    def __enter__(self):
+        self.compile_nodelist = getattr(Template, 'compile_nodelist', None)
+        if self.compile_nodelist is not None:
+            timer = self
+            compile_nodelist = self.compile_nodelist
+
+            def timed_compile_nodelist(template):
+                start = default_timer()
+                try:
+                    return compile_nodelist(template)
+                finally:
+                    timer.duration += default_timer() - start
+
+            Template.compile_nodelist = timed_compile_nodelist
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.compile_nodelist is not None:
+            Template.compile_nodelist = self.compile_nodelist
+
+
+def build_engine():
+    """
+    Return an engine configured like the default engine,
+    loading the templates with the app namespace loader only.
+    """
+    default_engine = Engine.get_default()
+    options = dict(
+        (option, getattr(default_engine, option)) for option in (
+            'dirs', 'context_processors', 'debug', 'string_if_invalid',
+            'file_charset', 'libraries')
+        if hasattr(default_engine, option))
+    return Engine(loaders=['app_namespace.Loader'], **options)
+
+
+def profile_templates(template_names, profiler=None):
+    """
+    Render the templates through a new engine using the app namespace
+    loader and return the time spent in each phase of the loader,
+    with the (template_name, error) of the templates failing.
+    Parsing the templates is timed with Django >= 1.9.
+    """
+    timings = OrderedDict((phase, 0.0) for phase in PHASES)
+    errors = []
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with override_settings(APP_NAMESPACE_INSTRUMENTATION=True):
+            engine = build_engine()
+            loader = engine.template_loaders[0]
+
+        start = default_timer()
+        loader.refresh()
+        loader.templates_dirs
+        timings['registry'] = default_timer() - start
+        start = default_timer()
+        loader.template_index
+        timings['index'] = default_timer() - start
+
+        loader.stats.reset()
+        total = 0.0
+        with ParseTimer() as parse_timer:
+            for template_name in template_names:
+                start = default_timer()
+                try:
+                    engine.get_template(template_name).render(Context())
+                except Exception as exception:
+                    errors.append((template_name, exception))
+                total += default_timer() - start
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+    snapshot = loader.stats.snapshot()
+    timings['lookup'] = snapshot['lookup_time']
+    timings['read'] = snapshot['read_time']
+    timings['parse'] = parse_timer.duration
+    timings['render'] = max(total - timings['lookup'] - timings['read'] -
+                            timings['parse'], 0.0)
+    return timings, errors
+
+
+def format_function(function):
+    filename, line, name = function
+    return '%s:%s(%s)' % (filename, line, name)
+
+
+def collapse_stats(stats, min_duration=1e-6):
+    """
+    Return the ordered dict of the collapsed call stacks of a
+    pstats.Stats with their self time in seconds, the time of a function
+    being split between its callers in proportion of their calls,
+    for the tools drawing flame graphs.
+    """
+    callees = {}
+    for function, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller, timing in callers.items():
+            callees.setdefault(caller, []).append((function, timing[3]))
+
+    stacks = OrderedDict()
+
+    def walk(function, stack, duration):
+        cc, nc, tt, ct, callers = stats.stats[function]
+        ratio = ct and duration / ct or 0.0
+        key = ';'.join(format_function(caller) for caller in stack)
+        stacks[key] = stacks.get(key, 0.0) + tt * ratio
+        for callee, callee_duration in sorted(callees.get(function, [])):
+            callee_duration *= ratio
+            if callee not in stack and callee_duration >= min_duration:
+                walk(callee, stack + [callee], callee_duration)
+
+    for function, (cc, nc, tt, ct, callers) in sorted(stats.stats.items()):
+        if not callers:
+            walk(function, [function], ct)
+    return stacks
+
+
+def write_collapsed_stacks(stats, path):
+    """
+    Write the collapsed stacks of a pstats.Stats in 'path',
+    one stack per line followed by its self time in microseconds.
+    """
+    with open(path, 'w') as fp:
+        for stack, duration in collapse_stats(stats).items():
+            microseconds = int(duration * 1e6)
+            if microseconds:
+                fp.write('%s %s\n' % (stack, microseconds))
+
+
+def profile(template_names, output):
+    """
+    Profile the rendering of the templates, writing the cProfile output
+    in '<output>.prof' and the collapsed stacks in '<output>.folded'.
+    """
+    profiler = cProfile.Profile()
+    timings, errors = profile_templates(template_names, profiler)
+    stats = pstats.Stats(profiler)
+    stats.dump_stats('%s.prof' % output)
+    write_collapsed_stacks(stats, '%s.folded' % output)
+    return timings, errors
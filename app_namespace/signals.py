@@ -0,0 +1,8 @@
+"""Signals of app-namespace"""
+from django.dispatch import Signal
+
+template_lookup = Signal(
+    providing_args=['loader', 'template_name', 'kind',
+                    'candidates', 'duration'])
+template_read = Signal(
+    providing_args=['loader', 'origin', 'size', 'duration'])
@@ -0,0 +1,135 @@
+"""Instrumentation of the loader for app-namespace"""
+import threading
+from timeit import default_timer
+
+from app_namespace.signals import template_lookup
+from app_namespace.signals import template_read
+
+from django.template import TemplateDoesNotExist
+
+LOOKUP_APP = 'app'
+LOOKUP_EMPTY = 'empty'
+LOOKUP_PASSTHROUGH = 'passthrough'
+
+
+def get_lookup_kind(template_name):
+    """
+    Return the kind of lookup done for a template name.
+    """
+    if ':' not in template_name:
+        return LOOKUP_PASSTHROUGH
+    if template_name.startswith(':'):
+        return LOOKUP_EMPTY
+    return LOOKUP_APP
+
+
+class LoaderStats(object):
+    """
+    Counters of the lookups and of the reads done by a loader,
+    sending the 'template_lookup' and 'template_read' signals.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Set all the counters to zero.
+        """
+        with self._lock:
+            self.lookups = {LOOKUP_APP: 0,
+                            LOOKUP_EMPTY: 0,
+                            LOOKUP_PASSTHROUGH: 0}
+            self.candidates = 0
+            self.max_candidates = 0
+            self.lookup_time = 0.0
+            self.reads = 0
+            self.not_found = 0
+            self.errors = 0
+            self.opens = 0
+            self.bytes_read = 0
+            self.read_time = 0.0
+
+    def track_sources(self, template_name, sources):
+        """
+        Iterate over the origins yielded by 'sources' for 'template_name',
+        counting them and timing their resolution.
+        """
+        kind = get_lookup_kind(template_name)
+        candidates = 0
+        duration = 0.0
+        try:
+            start = default_timer()
+            for origin in sources:
+                duration += default_timer() - start
+                candidates += 1
+                yield origin
+                start = default_timer()
+            duration += default_timer() - start
+        finally:
+            with self._lock:
+                self.lookups[kind] += 1
+                self.candidates += candidates
+                self.max_candidates = max(self.max_candidates, candidates)
+                self.lookup_time += duration
+            template_lookup.send(
+                sender=self.loader.__class__, loader=self.loader,
+                template_name=template_name, kind=kind,
+                candidates=candidates, duration=duration)
+
+    def track_contents(self, read, origin):
+        """
+        Read the contents of 'origin' with 'read',
+        counting the templates not found and the errors.
+        """
+        contents = size = None
+        not_found = False
+        start = default_timer()
+        try:
+            contents = read(origin)
+        except TemplateDoesNotExist:
+            not_found = True
+            raise
+        finally:
+            duration = default_timer() - start
+            if contents is not None:
+                size = len(contents)
+            with self._lock:
+                self.reads += 1
+                self.read_time += duration
+                if not_found:
+                    self.not_found += 1
+                elif contents is None:
+                    self.errors += 1
+            template_read.send(
+                sender=self.loader.__class__, loader=self.loader,
+                origin=origin, size=size, duration=duration)
+        return contents
+
+    def track_open(self, size):
+        """
+        Count a template file really opened and its size in bytes,
+        the sources served from the caches or the bundle excluded.
+        """
+        with self._lock:
+            self.opens += 1
+            self.bytes_read += size
+
+    def snapshot(self):
+        """
+        Return a copy of the counters.
+        """
+        with self._lock:
+            return {'lookups': dict(self.lookups),
+                    'candidates': self.candidates,
+                    'max_candidates': self.max_candidates,
+                    'lookup_time': self.lookup_time,
+                    'reads': self.reads,
+                    'not_found': self.not_found,
+                    'errors': self.errors,
+                    'opens': self.opens,
+                    'bytes_read': self.bytes_read,
+                    'read_time': self.read_time,
+                    'total_time': self.lookup_time + self.read_time}
@@ -0,0 +1,162 @@
+"""Concurrency stress test of the app namespace template loader"""
+import platform
+import threading
+from multiprocessing import Pool
+from timeit import default_timer
+
+from app_namespace.benchmark import APP_LOADER
+from app_namespace.benchmark import CACHED_LOADER
+from app_namespace.benchmark import SyntheticProject
+from app_namespace.benchmark import build_engine
+
+import django
+from django.template import Context
+
+THREADS = 'threads'
+PROCESSES = 'processes'
+
+_process_state = {}
+
+
+def get_template_names(project):
+    """
+    Return the names of the chain templates with an empty namespace,
+    and of the templates of the last application with its namespace.
+    """
+    last_app = project.apps[-1]
+    template_names = [':%s' % project.chain_name(i)
+                      for i in range(project.templates)]
+    template_names.extend('%s:%s' % (last_app, project.app_name(last_app, i))
+                          for i in range(project.templates))
+    return template_names
+
+
+def render(engine, template_name):
+    return engine.get_template(template_name).render(Context())
+
+
+def render_all(engine, template_names, expected, iterations):
+    """
+    Render the templates 'iterations' times and return the number
+    of renders and the names of the templates rendered differently
+    than expected.
+    """
+    renders = 0
+    mismatches = []
+    for i in range(iterations):
+        for template_name in template_names:
+            try:
+                output = render(engine, template_name)
+            except Exception as exception:
+                output = exception
+            if output != expected[template_name]:
+                mismatches.append(template_name)
+            renders += 1
+    return renders, mismatches
+
+
+def render_in_process(iterations):
+    return render_all(_process_state['engine'],
+                      _process_state['template_names'],
+                      _process_state['expected'], iterations)
+
+
+def stress_threads(engine, template_names, expected, workers, iterations):
+    """
+    Render the templates concurrently from 'workers' threads sharing
+    the engine, and return the number of renders, the duration
+    and the names of the templates rendered differently than expected.
+    """
+    start_gate = threading.Event()
+    results = []
+    lock = threading.Lock()
+
+    def target():
+        start_gate.wait()
+        result = render_all(engine, template_names, expected, iterations)
+        with lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=target) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    start = default_timer()
+    start_gate.set()
+    for thread in threads:
+        thread.join()
+    duration = default_timer() - start
+    return (sum(renders for renders, mismatches in results), duration,
+            [name for renders, mismatches in results for name in mismatches])
+
+
+def stress_processes(engine, template_names, expected, workers, iterations):
+    """
+    Render the templates from a pool of 'workers' forked processes,
+    each one inheriting the engine, and return like 'stress_threads'.
+    """
+    _process_state.update(engine=engine, template_names=template_names,
+                          expected=expected)
+    pool = Pool(workers)
+    try:
+        start = default_timer()
+        results = pool.map(render_in_process, [iterations] * workers)
+        duration = default_timer() - start
+    finally:
+        pool.close()
+        pool.join()
+        _process_state.clear()
+    return (sum(renders for renders, mismatches in results), duration,
+            [name for renders, mismatches in results for name in mismatches])
+
+
+def stress_loader(project, loader, workers, iterations, processes=False):
+    """
+    Compare the renders of the templates of the project from a growing
+    number of workers with the single-threaded renders.
+    """
+    template_names = get_template_names(project)
+    engine = build_engine(loader)
+    expected = dict((template_name, render(engine, template_name))
+                    for template_name in template_names)
+
+    modes = [(THREADS, stress_threads)]
+    if processes:
+        modes.append((PROCESSES, stress_processes))
+    results = []
+    for mode, stress in modes:
+        for worker_count in workers:
+            renders, duration, mismatches = stress(
+                build_engine(loader), template_names, expected,
+                worker_count, iterations)
+            results.append({
+                'loader': loader,
+                'mode': mode,
+                'workers': worker_count,
+                'renders': renders,
+                'duration': duration,
+                'renders_per_second': duration and renders / duration,
+                'mismatches': sorted(set(mismatches))})
+    return results
+
+
+def run(apps=10, templates=10, depth=5, workers=(1, 2, 4, 8),
+        iterations=10, processes=False):
+    """
+    Run the stress test on a synthetic project and return
+    the machine-readable results. The process pool requires
+    the fork start method of multiprocessing.
+    """
+    results = []
+    with SyntheticProject(apps, templates, depth, 'stress') as project:
+        for loader in (APP_LOADER, CACHED_LOADER):
+            results.extend(stress_loader(
+                project, loader, workers, iterations, processes))
+    return {
+        'parameters': {'apps': apps, 'templates': templates,
+                       'depth': depth, 'workers': list(workers),
+                       'iterations': iterations, 'processes': processes},
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform()},
+        'results': results}
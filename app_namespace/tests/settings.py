@@ -18,6 +18,7 @@ ROOT_URLCONF = 'app_namespace.tests.urls'
 
 INSTALLED_APPS = ('django.contrib.auth',
                   'django.contrib.admin',
-                  'django.contrib.contenttypes')
+                  'django.contrib.contenttypes',
+                  'app_namespace')
 
 SILENCED_SYSTEM_CHECKS = ['1_7.W001']
@@ -1,12 +1,43 @@
 """Tests for app_namespace"""
+import json
 import os
 import shutil
+import subprocess
 import sys
 import tempfile
+import threading
+import time
+import unittest
+import warnings
+try:
+    import asyncio
+except ImportError:  # Python 2
+    asyncio = None
 
+import app_namespace
 from app_namespace import Loader
+from app_namespace.benchmark import SyntheticProject
+from app_namespace.cache import LRUCache
+from app_namespace.cache import SharedSourceCache
+from app_namespace.cache import SourceCache
+from app_namespace.index import build_cached_index
+from app_namespace.loader import PASSTHROUGH
+from app_namespace.management.commands import app_namespace_graph \
+    as graph_command
+from app_namespace.signals import template_lookup
+from app_namespace.signals import template_read
+from app_namespace.utils import get_stat_fingerprint
+from app_namespace.utils import read_mmap
+from app_namespace.warmup import build_indexes
+from app_namespace.warmup import get_namespace_loaders
+from app_namespace.warmup import warmup
+from app_namespace.watcher import InotifyWatcher
+from app_namespace.watcher import PollingWatcher
 
 import django
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.urlresolvers import reverse
 from django.template import TemplateDoesNotExist
 from django.template.base import Context
@@ -15,6 +46,7 @@ from django.template.engine import Engine
 from django.template.loaders import app_directories
 from django.test import TestCase
 from django.test.utils import override_settings
+from django.utils.six import StringIO
 
 
 class LoaderTestCase(TestCase):
@@ -89,6 +121,285 @@ class LoaderTestCase(TestCase):
 
         self.assertEquals(template_short[0], template_dotted[0])
 
+    def test_template_index(self):
+        app_namespace_loader = Loader(Engine())
+        index = app_namespace_loader.template_index
+
+        self.assertEquals(index.get_apps('admin/base.html'),
+                          ('django.contrib.admin',))
+        self.assertEquals(index.get_apps('admin/./base.html'),
+                          ('django.contrib.admin',))
+        self.assertEquals(index.get_apps('admin/base_invalid.html'), ())
+        self.assertTrue('admin/base.html' in index)
+        self.assertFalse('template' in index)
+        self.assertTrue(app_namespace_loader.template_index is index)
+
+        origins = list(app_namespace_loader.get_template_sources(
+            ':admin/base.html'))
+        self.assertEquals([origin.app_name for origin in origins],
+                          ['django.contrib.admin'])
+        self.assertEquals(list(app_namespace_loader.get_template_sources(
+            ':admin/base_invalid.html')), [])
+
+    def test_template_index_registry_changed(self):
+        app_namespace_loader = Loader(Engine())
+        index = app_namespace_loader.template_index
+
+        with self.settings(INSTALLED_APPS=['django.contrib.auth']):
+            self.assertFalse(
+                'admin/base.html' in app_namespace_loader.template_index)
+            self.assertFalse(
+                'admin' in app_namespace_loader.app_templates_dirs)
+        self.assertTrue(
+            'admin/base.html' in app_namespace_loader.template_index)
+        self.assertTrue(app_namespace_loader.template_index is index)
+
+    def test_registry_changed_incrementally(self):
+        app_namespace_loader = Loader(Engine())
+        admin_dir = app_namespace_loader.templates_dirs['django.contrib.admin']
+        admin_templates = app_namespace_loader.get_dir_templates(admin_dir)
+        admin_path = app_namespace_loader.get_app_template_path(
+            'admin', 'admin/base.html')
+        app_namespace_loader.get_app_template_path(
+            'auth', 'registration/password_reset_subject.txt')
+
+        with self.settings(INSTALLED_APPS=['django.contrib.admin']):
+            app_namespace_loader.refresh()
+            self.assertEquals(list(app_namespace_loader.app_templates_dirs),
+                              ['django.contrib.admin', 'admin'])
+            self.assertTrue(app_namespace_loader.get_app_template_path(
+                'admin', 'admin/base.html') is admin_path)
+            self.assertFalse(
+                ('auth', 'registration/password_reset_subject.txt') in
+                app_namespace_loader._template_paths)
+            self.assertTrue(app_namespace_loader.get_dir_templates(
+                admin_dir) is admin_templates)
+            index = app_namespace_loader.scan_templates_dirs(
+                app_namespace_loader.templates_dirs)
+            self.assertTrue('admin/base.html' in index)
+            self.assertFalse('registration/password_reset_subject.txt'
+                             in index)
+
+    def test_template_index_concurrent_refresh(self):
+        app_namespace_loader = Loader(Engine())
+        errors = []
+
+        def lookup():
+            try:
+                for i in range(50):
+                    app_namespace_loader.template_index.get_apps(
+                        'admin/base.html')
+            except Exception as exception:
+                errors.append(exception)
+
+        threads = [threading.Thread(target=lookup) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for i in range(200):
+            app_namespace_loader._app_configs = None
+            app_namespace_loader.refresh()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(errors, [])
+
+    def test_template_index_shared(self):
+        index = Loader(Engine()).template_index
+        self.assertTrue(Loader(Engine()).template_index is index)
+        self.assertTrue(isinstance(index.get_apps('admin/base.html'), tuple))
+        with self.settings(APP_NAMESPACE_WATCH=True):
+            app_namespace_loader = Loader(Engine())
+            self.assertFalse(app_namespace_loader.template_index is index)
+            app_namespace_loader.watcher.stop()
+
+    def test_template_index_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'index.json')
+        with self.settings(APP_NAMESPACE_INDEX_CACHE=path):
+            app_namespace_loader = Loader(Engine())
+        templates_dirs = app_namespace_loader.templates_dirs
+        admin_dir = templates_dirs['django.contrib.admin']
+
+        index = app_namespace_loader.build_template_index(templates_dirs)
+        self.assertTrue('admin/base.html' in index)
+        with open(path) as fp:
+            cache = json.load(fp)
+        self.assertEquals(cache['apps'], [list(item) for item in
+                                          templates_dirs.items()])
+
+        cache['dirs'][admin_dir]['templates'].append('admin/cached.html')
+        with open(path, 'w') as fp:
+            json.dump(cache, fp)
+        index = build_cached_index(path, templates_dirs)
+        self.assertTrue('admin/cached.html' in index)
+
+        cache['dirs'][admin_dir]['fingerprint']['admin'] = 0
+        with open(path, 'w') as fp:
+            json.dump(cache, fp)
+        index = build_cached_index(path, templates_dirs)
+        self.assertFalse('admin/cached.html' in index)
+        self.assertTrue('admin/base.html' in index)
+
+        with open(path) as fp:
+            cache = json.load(fp)
+        cache['dirs'][admin_dir]['templates'].append('admin/cached.html')
+        with open(path, 'w') as fp:
+            json.dump(cache, fp)
+        with self.settings(APP_NAMESPACE_INDEX_CACHE=path,
+                           APP_NAMESPACE_WATCH=True):
+            app_namespace_loader = Loader(Engine())
+            self.assertTrue(
+                'admin/cached.html' in app_namespace_loader.template_index)
+            app_namespace_loader.watcher.stop()
+
+    def test_select_template_origin(self):
+        app_namespace_loader = Loader(Engine())
+        origin = app_namespace_loader.select_template_origin(
+            ['auth:admin/base.html', 'admin:admin/base_invalid.html',
+             ':admin/base_invalid.html', 'invalid:admin/base.html',
+             'admin:admin/base.html', ':admin/base.html'])
+        self.assertEquals(origin.template_name, 'admin/base.html')
+        self.assertEquals(origin.app_name, 'admin')
+        origin = app_namespace_loader.select_template_origin(
+            ['auth:admin/base.html', ':admin/base.html', 'admin/base.html'])
+        self.assertEquals(origin.app_name, 'django.contrib.admin')
+        self.assertEquals(app_namespace_loader.select_template_origin(
+            [':admin/base_invalid.html']), None)
+        self.assertEquals(app_namespace_loader.select_template_origin(
+            [':admin/base_invalid.html', 'admin/base.html',
+             'admin:admin/base.html']), PASSTHROUGH)
+        self.assertEquals(app_namespace_loader.get_contents(origin),
+                          app_namespace_loader.load_template_source(
+                              'admin:admin/base.html')[0])
+
+    def test_routing_table(self):
+        routing_table = Loader(Engine()).routing_table
+        self.assertEquals(routing_table['admin'], ('django.contrib.admin',))
+        self.assertEquals(routing_table['registration'],
+                          ('django.contrib.auth', 'django.contrib.admin'))
+
+        with self.settings(APP_NAMESPACE_ROUTES={'registration': ['admin']}):
+            app_namespace_loader = Loader(Engine())
+        self.assertEquals(app_namespace_loader.routing_table['registration'],
+                          ('django.contrib.admin',))
+        self.assertEquals(list(app_namespace_loader.get_template_sources(
+            ':registration/password_reset_subject.txt')), [])
+        self.assertEquals(
+            [origin.app_name for origin in
+             app_namespace_loader.get_template_sources(
+                 ':registration/logged_out.html')],
+            ['django.contrib.admin'])
+        self.assertEquals(
+            [origin.app_name for origin in
+             app_namespace_loader.get_template_sources(':admin/base.html')],
+            ['django.contrib.admin'])
+
+        out = StringIO()
+        call_command('app_namespace_routes', stdout=out)
+        self.assertTrue('admin/: django.contrib.admin\n' in out.getvalue())
+
+    def test_lazy_app_templates_dirs(self):
+        app_namespace_loader = Loader(Engine())
+        app_namespace_loader.load_template_source('admin:admin/base.html')
+        self.assertRaises(TemplateDoesNotExist,
+                          app_namespace_loader.load_template_source,
+                          'auth:admin/base.html')
+        self.assertRaises(TemplateDoesNotExist,
+                          app_namespace_loader.load_template_source,
+                          'no.app.namespace:template')
+        self.assertFalse('app_templates_dirs' in
+                         app_namespace_loader.__dict__)
+        self.assertEquals(
+            app_namespace_loader.get_app_templates_dir(
+                'django.contrib.admin'),
+            app_namespace_loader.get_app_templates_dir('admin'))
+
+        app_namespace_loader.load_template_source(':admin/base.html')
+        self.assertTrue('app_templates_dirs' in
+                        app_namespace_loader.__dict__)
+        self.assertEquals(
+            app_namespace_loader.get_app_templates_dir('admin'),
+            app_namespace_loader.app_templates_dirs['admin'])
+
+    def test_templates_dirs_deduplicated(self):
+        app_namespace_loader = Loader(Engine())
+        self.assertEquals(list(app_namespace_loader.templates_dirs),
+                          ['django.contrib.auth', 'django.contrib.admin'])
+        self.assertEquals(len(app_namespace_loader.app_templates_dirs), 4)
+        self.assertEquals(app_namespace_loader.app_aliases['admin'],
+                          'django.contrib.admin')
+        self.assertEquals(
+            app_namespace_loader.app_aliases['django.contrib.admin'],
+            'django.contrib.admin')
+
+    def test_origins_reused(self):
+        app_namespace_loader = Loader(Engine())
+        origin = list(app_namespace_loader.get_template_sources(
+            ':admin/base.html'))[0]
+        self.assertTrue(origin is list(
+            app_namespace_loader.get_template_sources(
+                ':admin/base.html'))[0])
+        self.assertFalse(origin is list(
+            app_namespace_loader.get_template_sources(
+                'django.contrib.admin:admin/base.html'))[0])
+
+        app_namespace_loader.origins_pool_size = 1
+        list(app_namespace_loader.get_template_sources(
+            'admin:admin/base.html'))
+        self.assertEquals(len(app_namespace_loader._origins), 1)
+
+    def test_template_paths_memoized(self):
+        app_namespace_loader = Loader(Engine())
+        path = app_namespace_loader.get_app_template_path(
+            'admin', 'admin/base.html')
+        self.assertTrue(path is app_namespace_loader.get_app_template_path(
+            'admin', 'admin/base.html'))
+        with self.settings(INSTALLED_APPS=['django.contrib.auth']):
+            app_namespace_loader.refresh()
+            self.assertRaises(KeyError,
+                              app_namespace_loader.get_app_template_path,
+                              'admin', 'admin/base.html')
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 10),
+                     'Includes are cached by render on Django >= 1.10')
+    def test_include_resolved_once_per_render(self):
+        with SyntheticProject(apps=3, templates=1, depth=3,
+                              prefix='include'):
+            with self.settings(APP_NAMESPACE_INSTRUMENTATION=True):
+                engine = Engine(loaders=['app_namespace.Loader'])
+                app_namespace_loader = engine.template_loaders[0]
+            template = engine.from_string(
+                '{% for i in items %}'
+                '{% include ":chain/template_0.html" %}'
+                '{% include "include_app_2:chain/template_0.html" %}'
+                '{% endfor %}')
+            lookups = []
+            for i in range(2):
+                app_namespace_loader.stats.reset()
+                self.assertEquals(
+                    template.render(Context({'items': range(5)})).count(
+                        'include_app_2'), 10)
+                lookups.append(app_namespace_loader.stats.snapshot()[
+                    'lookups'])
+            self.assertEquals(lookups[0]['app'], 1)
+            self.assertEquals(lookups[0], lookups[1])
+
+    def test_already_used_thread_local(self):
+        app_namespace_loader = Loader(Engine())
+        already_used = []
+
+        def lookup():
+            list(app_namespace_loader.get_template_sources(
+                ':admin/base.html'))
+            already_used.extend(app_namespace_loader._already_used)
+
+        thread = threading.Thread(target=lookup)
+        thread.start()
+        thread.join()
+
+        self.assertEquals(len(already_used), 1)
+        self.assertEquals(app_namespace_loader._already_used, set())
+
     def test_load_template_invalid_namespace_valid_template(self):
         app_namespace_loader = Loader(Engine())
         with self.assertRaises(TemplateDoesNotExist):
@@ -102,6 +413,526 @@ class LoaderTestCase(TestCase):
                 'admin:admin/base_invalid.html')
 
 
+class LRUCacheTestCase(TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEquals(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEquals(cache.stats(), {'hits': 2, 'misses': 1,
+                                          'evictions': 1, 'size': 2,
+                                          'maxsize': 2})
+
+    def test_ttl(self):
+        cache = LRUCache(2, ttl=0.01)
+        cache.set('a', 1)
+        self.assertTrue('a' in cache)
+        time.sleep(0.02)
+        self.assertFalse('a' in cache)
+        self.assertEquals(len(cache), 0)
+
+
+class SourceCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_read(self):
+        cache = SourceCache(10000)
+        path = self.write('template.html', b'caf\xc3\xa9\r\nline')
+        self.assertEquals(cache.read(path, 'utf-8'), u'caf\xe9\nline')
+        self.assertEquals(cache.read(path, 'utf-8'), u'caf\xe9\nline')
+        self.assertEquals(cache.hits, 1)
+
+        self.write('template.html', b'changed')
+        self.assertEquals(cache.read(path, 'utf-8'), u'changed')
+        self.assertEquals(cache.misses, 2)
+        self.assertEquals(len(cache), 1)
+        self.assertEquals(cache.read(self.write('empty.html', b''),
+                                     'utf-8'), u'')
+        self.assertRaises(OSError, cache.read,
+                          os.path.join(self.directory, 'missing'), 'utf-8')
+
+    def test_truncated_file(self):
+        path = self.write('template.html', b'content')
+        size = os.stat(path).st_size
+        self.write('template.html', b'')
+        self.assertEquals(read_mmap(path, size, 'utf-8'), u'')
+
+    def test_replaced_file(self):
+        cache = SourceCache(10000)
+        mtime = int(time.time()) - 10
+        path = self.write('template.html', b'first')
+        os.utime(path, (mtime, mtime))
+        self.assertEquals(cache.read(path, 'utf-8'), u'first')
+        stat = os.stat(path)
+        replacement = self.write('replacement.html', b'other')
+        os.utime(replacement, (mtime, mtime))
+        os.rename(replacement, path)
+        self.assertEquals(get_stat_fingerprint(os.stat(path))[1:],
+                          get_stat_fingerprint(stat)[1:])
+        self.assertEquals(cache.read(path, 'utf-8'), u'other')
+        self.assertEquals(cache.stats()['misses'], 2)
+
+    def test_bounded_by_bytes(self):
+        first = self.write('first.html', b'a' * 100)
+        second = self.write('second.html', b'b' * 100)
+        cache = SourceCache(1)
+        cache.read(first, 'utf-8')
+        self.assertEquals(cache.stats()['resident_bytes'], 0)
+
+        cache = SourceCache(sys.getsizeof(u'a' * 100) + 10)
+        cache.read(first, 'utf-8')
+        cache.read(second, 'utf-8')
+        stats = cache.stats()
+        self.assertEquals(stats['size'], 1)
+        self.assertEquals(stats['evictions'], 1)
+        self.assertEquals(stats['resident_bytes'],
+                          sys.getsizeof(u'b' * 100))
+        cache.delete(second)
+        self.assertEquals(cache.resident_bytes, 0)
+
+    def test_compress(self):
+        path = self.write('template.html', b'caf\xc3\xa9 ' * 1000)
+        cache = SourceCache(10000, compress=True)
+        self.assertEquals(cache.read(path, 'utf-8'), u'caf\xe9 ' * 1000)
+        self.assertEquals(cache.read(path, 'utf-8'), u'caf\xe9 ' * 1000)
+        stats = cache.stats()
+        self.assertEquals(stats['hits'], 1)
+        self.assertEquals(stats['source_bytes'],
+                          sys.getsizeof(u'caf\xe9 ' * 1000))
+        self.assertTrue(stats['resident_bytes'] < 1000)
+        self.assertTrue(stats['compression_ratio'] > 10)
+        cache.clear()
+        self.assertEquals(cache.stats()['compression_ratio'], 1.0)
+
+    @override_settings(APP_NAMESPACE_SOURCE_CACHE_SIZE=1024 * 1024)
+    def test_loader_source_cache(self):
+        app_namespace_loader = Loader(Engine())
+        app_directory_loader = app_directories.Loader(Engine())
+
+        template_directory = app_directory_loader.load_template_source(
+            'admin/base.html')
+        for i in range(2):
+            template_namespace = app_namespace_loader.load_template_source(
+                'admin:admin/base.html')
+            self.assertEquals(template_directory[0], template_namespace[0])
+        self.assertEquals(app_namespace_loader.source_cache.hits, 1)
+        self.assertRaises(TemplateDoesNotExist,
+                          app_namespace_loader.load_template_source,
+                          'admin:admin/base_invalid.html')
+
+
+class SharedSourceCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.caches = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'templates': {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                'FileBasedCache',
+                'LOCATION': os.path.join(self.directory, 'cache')}})
+        self.caches.enable()
+
+    def tearDown(self):
+        self.caches.disable()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_read(self):
+        path = self.write('template.html', b'caf\xc3\xa9\r\nline')
+        cache = SharedSourceCache('templates')
+        self.assertEquals(cache.read(('app', 'template.html'), path,
+                                     'utf-8'), u'caf\xe9\nline')
+        other_cache = SharedSourceCache('templates')
+        self.assertEquals(other_cache.read(('app', 'template.html'), path,
+                                           'utf-8'), u'caf\xe9\nline')
+        self.assertEquals(other_cache.stats(),
+                          {'hits': 1, 'misses': 0, 'waits': 0})
+
+        self.write('template.html', b'changed')
+        self.assertEquals(other_cache.read(('app', 'template.html'), path,
+                                           'utf-8'), u'changed')
+        self.assertEquals(other_cache.misses, 1)
+
+    def test_stampede_guard(self):
+        path = self.write('template.html', b'content')
+        cache = SharedSourceCache('templates', lock_timeout=5)
+        cache_key = cache.make_key(('app', 'template.html'),
+                                   get_stat_fingerprint(os.stat(path)))
+        cache.cache.add(cache_key + ':lock', 0)
+        timer = threading.Timer(0.1, cache.cache.set,
+                                (cache_key, u'from another worker'))
+        timer.start()
+        self.assertEquals(cache.read(('app', 'template.html'), path,
+                                     'utf-8'), u'from another worker')
+        timer.join()
+        self.assertEquals(cache.waits, 1)
+
+    def test_loader_source_cache(self):
+        with self.settings(APP_NAMESPACE_SHARED_CACHE='templates'):
+            app_namespace_loader = Loader(Engine())
+        self.assertEquals(app_namespace_loader.shared_cache.timeout,
+                          DEFAULT_TIMEOUT)
+        for i in range(2):
+            template_namespace = app_namespace_loader.load_template_source(
+                'admin:admin/base.html')
+        self.assertEquals(template_namespace[0], app_directories.Loader(
+            Engine()).load_template_source('admin/base.html')[0])
+        self.assertEquals(app_namespace_loader.shared_cache.hits, 1)
+
+
+class InstrumentationTestCase(TestCase):
+
+    def test_disabled(self):
+        self.assertEquals(Loader(Engine()).stats, None)
+
+    @override_settings(APP_NAMESPACE_INSTRUMENTATION=True)
+    def test_stats(self):
+        lookups = []
+        reads = []
+
+        def lookup_receiver(sender, **kwargs):
+            lookups.append((kwargs['template_name'], kwargs['kind'],
+                            kwargs['candidates']))
+
+        def read_receiver(sender, **kwargs):
+            reads.append((kwargs['origin'].name, kwargs['size']))
+
+        template_lookup.connect(lookup_receiver)
+        template_read.connect(read_receiver)
+        try:
+            app_namespace_loader = Loader(Engine())
+            source = app_namespace_loader.load_template_source(
+                ':admin/base.html')[0]
+            self.assertRaises(TemplateDoesNotExist,
+                              app_namespace_loader.load_template_source,
+                              'admin:admin/base_invalid.html')
+            self.assertRaises(TemplateDoesNotExist,
+                              app_namespace_loader.load_template_source,
+                              'admin/base.html')
+        finally:
+            template_lookup.disconnect(lookup_receiver)
+            template_read.disconnect(read_receiver)
+
+        self.assertEquals(lookups, [
+            (':admin/base.html', 'empty', 1),
+            ('admin:admin/base_invalid.html', 'app', 1),
+            ('admin/base.html', 'passthrough', 0)])
+        self.assertEquals(reads[1], (
+            'app_namespace:admin:admin:admin/base_invalid.html', None))
+
+        stats = app_namespace_loader.stats.snapshot()
+        self.assertEquals(stats['lookups'], {'app': 1, 'empty': 1,
+                                             'passthrough': 1})
+        self.assertEquals(stats['candidates'], 2)
+        self.assertEquals(stats['max_candidates'], 1)
+        self.assertEquals(stats['reads'], 2)
+        self.assertEquals(stats['not_found'], 1)
+        self.assertEquals(stats['errors'], 0)
+        self.assertEquals(stats['opens'], 1)
+        self.assertEquals(stats['bytes_read'], len(source.encode('utf-8')))
+        self.assertTrue(stats['total_time'] > 0)
+
+        def read_error(origin):
+            raise UnicodeDecodeError('utf-8', b'', 0, 1, 'invalid')
+        self.assertRaises(UnicodeDecodeError,
+                          app_namespace_loader.stats.track_contents,
+                          read_error, None)
+        stats = app_namespace_loader.stats.snapshot()
+        self.assertEquals(stats['not_found'], 1)
+        self.assertEquals(stats['errors'], 1)
+
+        app_namespace_loader.stats.reset()
+        self.assertEquals(app_namespace_loader.stats.snapshot()['reads'], 0)
+
+
+@unittest.skipIf(asyncio is None, 'asyncio unavailable')
+class AsyncTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.loader = Loader(Engine())
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_aget_template_sources(self):
+        app_namespace_loader = self.loader
+        origins = self.loop.run_until_complete(
+            app_namespace_loader.aget_template_sources(
+                ':admin/base.html', self.loop))
+        self.assertEquals([origin.app_name for origin in origins],
+                          ['django.contrib.admin'])
+        self.assertEquals(self.loop.run_until_complete(
+            app_namespace_loader.aget_template_sources(
+                'admin:admin/base_invalid.html', self.loop)), [])
+        self.assertEquals(self.loop.run_until_complete(
+            app_namespace_loader.aget_template_sources(
+                'admin/base.html', self.loop)), [])
+
+    def test_aget_contents(self):
+        app_namespace_loader = self.loader
+        origin = list(app_namespace_loader.get_template_sources(
+            'admin:admin/base.html'))[0]
+        self.assertEquals(
+            self.loop.run_until_complete(
+                app_namespace_loader.aget_contents(origin, self.loop)),
+            app_namespace_loader.get_contents(origin))
+
+        origin = list(app_namespace_loader.get_template_sources(
+            'admin:admin/base_invalid.html'))[0]
+        with self.assertRaises(TemplateDoesNotExist):
+            self.loop.run_until_complete(
+                app_namespace_loader.aget_contents(origin, self.loop))
+
+    def test_executor_shared(self):
+        self.assertTrue(Loader(Engine()).executor is self.loader.executor)
+
+    def test_map_in_executor_empty(self):
+        from app_namespace.aio import map_in_executor
+        app_namespace_loader = self.loader
+        self.assertEquals(self.loop.run_until_complete(map_in_executor(
+            self.loop, app_namespace_loader.executor, len, [])), [])
+
+
+class NegativeCacheTestCase(TestCase):
+
+    def test_disabled(self):
+        self.assertEquals(Loader(Engine()).negative_cache, None)
+
+    @override_settings(APP_NAMESPACE_NEGATIVE_CACHE_SIZE=1)
+    def test_negative_cache(self):
+        app_namespace_loader = Loader(Engine())
+        negative_cache = app_namespace_loader.negative_cache
+
+        for i in range(2):
+            self.assertRaises(TemplateDoesNotExist,
+                              app_namespace_loader.load_template_source,
+                              'no.app.namespace:template')
+        self.assertEquals(negative_cache.hits, 1)
+        self.assertEquals(list(app_namespace_loader.get_template_sources(
+            'no.app.namespace:template')), [])
+
+        self.assertRaises(TemplateDoesNotExist,
+                          app_namespace_loader.load_template_source,
+                          'admin:admin/base_invalid.html')
+        self.assertTrue(('admin', 'admin/base_invalid.html')
+                        in negative_cache)
+        self.assertEquals(negative_cache.evictions, 1)
+        app_namespace_loader.load_template_source('admin:admin/base.html')
+
+
+def wait_for(condition, timeout=5):
+    """
+    Wait until the condition is true or the timeout is reached.
+    """
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class WatcherTestCase(TestCase):
+    watcher_class = PollingWatcher
+
+    def setUp(self):
+        self.events = []
+        self.templates_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.templates_dir, 'existing.html'),
+                  'w') as f:
+            f.write('existing')
+        self.watcher = self.watcher_class(
+            [self.templates_dir], self, interval=0.01)
+        self.watcher.start()
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.watcher.join()
+        shutil.rmtree(self.templates_dir)
+
+    def template_changed(self, templates_dir, template_path, event):
+        self.events.append((template_path, event))
+
+    def test_watch(self):
+        os.makedirs(os.path.join(self.templates_dir, 'sub'))
+        with open(os.path.join(self.templates_dir, 'sub', 'new.html'),
+                  'w') as f:
+            f.write('new')
+        self.assertTrue(wait_for(
+            lambda: ('sub/new.html', 'created') in self.events))
+
+        with open(os.path.join(self.templates_dir, 'existing.html'),
+                  'w') as f:
+            f.write('modified existing')
+        self.assertTrue(wait_for(
+            lambda: ('existing.html', 'modified') in self.events))
+
+        os.remove(os.path.join(self.templates_dir, 'existing.html'))
+        self.assertTrue(wait_for(
+            lambda: ('existing.html', 'deleted') in self.events))
+
+        shutil.rmtree(os.path.join(self.templates_dir, 'sub'))
+        self.assertTrue(wait_for(
+            lambda: ('sub/new.html', 'deleted') in self.events))
+        time.sleep(0.1)
+        self.assertEquals([event for event in self.events
+                           if event[0] == 'sub'], [])
+
+
+@unittest.skipUnless(InotifyWatcher.is_available(), 'inotify unavailable')
+class InotifyWatcherTestCase(WatcherTestCase):
+    watcher_class = InotifyWatcher
+
+    def test_libc_loaded_lazily(self):
+        output = subprocess.check_output(
+            [sys.executable, '-c',
+             'from app_namespace.watcher import InotifyWatcher; '
+             'print(InotifyWatcher.libc_loaded)'],
+            cwd=os.path.dirname(os.path.dirname(app_namespace.__file__)))
+        self.assertEquals(output.strip(), b'False')
+
+
+class BundleTestCase(TestCase):
+
+    def setUp(self):
+        self.bundle_directory = tempfile.mkdtemp()
+        self.bundle_path = os.path.join(self.bundle_directory, 'bundle')
+        call_command('app_namespace_bundle', self.bundle_path,
+                     stdout=StringIO())
+
+    def tearDown(self):
+        shutil.rmtree(self.bundle_directory)
+
+    def test_check(self):
+        out = StringIO()
+        call_command('app_namespace_bundle', self.bundle_path,
+                     check=True, stdout=out)
+        self.assertTrue('is up to date' in out.getvalue())
+        with self.settings(INSTALLED_APPS=['django.contrib.auth']):
+            with self.assertRaises(CommandError):
+                call_command('app_namespace_bundle', self.bundle_path,
+                             check=True, stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('app_namespace_bundle', check=True, stdout=out)
+
+    def test_load_template_source(self):
+        app_directory_loader = app_directories.Loader(Engine())
+        template_directory = app_directory_loader.load_template_source(
+            'admin/base.html')
+
+        with self.settings(APP_NAMESPACE_BUNDLE=self.bundle_path):
+            app_namespace_loader = Loader(Engine())
+            self.assertTrue(len(app_namespace_loader.bundle) > 0)
+            self.assertEquals(
+                app_namespace_loader.load_template_source(
+                    'admin:admin/base.html')[0],
+                template_directory[0])
+            self.assertEquals(
+                app_namespace_loader.load_template_source(
+                    ':admin/base.html')[0],
+                template_directory[0])
+            self.assertRaises(TemplateDoesNotExist,
+                              app_namespace_loader.load_template_source,
+                              'admin:admin/base_invalid.html')
+            self.assertRaises(TemplateDoesNotExist,
+                              app_namespace_loader.load_template_source,
+                              'no.app.namespace:template')
+
+    def test_bundle_closed_on_registry_change(self):
+        with self.settings(APP_NAMESPACE_BUNDLE=self.bundle_path):
+            app_namespace_loader = Loader(Engine())
+        bundle = app_namespace_loader.bundle
+        self.assertTrue(bundle.read('admin', 'admin/base.html'))
+        with self.settings(INSTALLED_APPS=['django.contrib.admin']):
+            app_namespace_loader.refresh()
+        self.assertRaises(ValueError, bundle.read, 'admin', 'admin/base.html')
+
+    def test_stale_bundle(self):
+        with self.settings(APP_NAMESPACE_BUNDLE=self.bundle_path,
+                           INSTALLED_APPS=['django.contrib.admin']):
+            with warnings.catch_warnings(record=True) as messages:
+                warnings.simplefilter('always')
+                self.assertEquals(Loader(Engine()).bundle, None)
+            self.assertTrue('is stale' in str(messages[0].message))
+
+
+@override_settings(
+    TEMPLATES=[
+        {
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'OPTIONS': {
+                'loaders': [
+                    ('app_namespace.CachedLoader', [
+                        'app_namespace.Loader',
+                        'django.template.loaders.app_directories.Loader']),
+                ],
+                'context_processors': [
+                    'django.contrib.auth.context_processors.auth'],
+            }
+        }
+    ]
+)
+class WarmupTestCase(TestCase):
+
+    def test_warmup(self):
+        engine = Engine.get_default()
+        cached_loader = engine.template_loaders[0]
+        self.assertEquals(len(get_namespace_loaders(engine)), 1)
+
+        results = warmup(concurrency=2)
+        template_names = [result[0] for result in results]
+        self.assertTrue(':admin/base.html' in template_names)
+        self.assertTrue('admin:admin/base.html' in template_names)
+        self.assertTrue('django.contrib.admin:admin/base.html'
+                        in template_names)
+        self.assertTrue(all(result[1] >= 0 for result in results))
+        self.assertTrue(len(cached_loader.get_template_cache) >=
+                        len(results))
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 9),
+                     'Chains are resolved with skip on Django >= 1.9')
+    def test_warmup_chains(self):
+        with SyntheticProject(apps=4, templates=1, depth=3,
+                              prefix='warmchain'):
+            engine = Engine(loaders=[('app_namespace.CachedLoader',
+                                      ['app_namespace.Loader'])])
+            cached_loader = engine.template_loaders[0]
+            warmup(engines=[engine])
+            cache_keys = set(cached_loader.get_template_cache)
+            engine.from_string(
+                '{% extends ":chain/template_0.html" %}').render(Context())
+            self.assertEquals(set(cached_loader.get_template_cache),
+                              cache_keys)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('app_namespace_warmup', concurrency=2,
+                     verbosity=2, stdout=out)
+        self.assertTrue('ms  admin:admin/base.html' in out.getvalue())
+        self.assertTrue('templates warmed up' in out.getvalue())
+
+
 @override_settings(
     TEMPLATES=[
         {
@@ -113,6 +944,120 @@ class LoaderTestCase(TestCase):
         }
     ]
 )
+class GraphTestCase(TestCase):
+
+    def test_chains(self):
+        with SyntheticProject(apps=4, templates=1, depth=3,
+                              prefix='graph') as project:
+            project.write(os.path.join(
+                project.directory, 'graph_app_3', 'templates', 'cycle.html'),
+                '{% extends "graph_app_3:cycle.html" %}')
+            graph = Loader(Engine()).template_graph
+            self.assertEquals(
+                graph.get_chain('graph_app_0', 'chain/template_0.html'),
+                (('graph_app_0', 'chain/template_0.html'),
+                 ('graph_app_1', 'chain/template_0.html'),
+                 ('graph_app_2', 'chain/template_0.html')))
+            self.assertEquals(
+                graph.get_chain('graph_app_1', './chain/template_0.html'),
+                (('graph_app_1', 'chain/template_0.html'),
+                 ('graph_app_0', 'chain/template_0.html'),
+                 ('graph_app_2', 'chain/template_0.html')))
+            exported = graph.as_dict()
+            self.assertEquals(
+                exported['graph_app_0:chain/template_0.html']['depth'], 3)
+            self.assertTrue(exported['graph_app_3:cycle.html']['cyclic'])
+
+    def test_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'graph.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        out = StringIO()
+        with SyntheticProject(apps=3, templates=1, depth=3,
+                              prefix='graphcommand'):
+            call_command(graph_command.Command(), max_depth=2,
+                         output=path, stdout=out)
+        with open(path) as fp:
+            graph = json.load(fp)
+        self.assertEquals(
+            graph['graphcommand_app_2:chain/template_0.html']['chain'],
+            ['graphcommand_app_2:chain/template_0.html'])
+        self.assertTrue('Deep chain (3): graphcommand_app_0:chain/'
+                        'template_0.html' in out.getvalue())
+        self.assertTrue('0 cyclic chains' in out.getvalue())
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 9),
+                     'Chains are resolved with skip on Django >= 1.9')
+    def test_load_chain_in_one_step(self):
+        with SyntheticProject(apps=4, templates=1, depth=3,
+                              prefix='onestep') as project:
+            template = '{% extends ":chain/template_0.html" %}'
+            expected = Engine(loaders=['app_namespace.Loader']).from_string(
+                template).render(Context())
+            with self.settings(APP_NAMESPACE_GRAPH=True):
+                engine = Engine(loaders=['app_namespace.Loader'])
+                loader = engine.template_loaders[0]
+            self.assertEquals(engine.from_string(template).render(Context()),
+                              expected)
+            self.assertEquals(len(loader.template_graph.chains), 7)
+            head = loader.get_template(':chain/template_0.html')
+            self.assertEquals(head.origin.app_name, project.apps[0])
+            chained = loader.get_chained_template(
+                ':chain/template_0.html', [head.origin])
+            self.assertEquals(chained.origin.app_name, project.apps[1])
+            self.assertEquals(loader.get_chained_template(
+                ':chain/template_0.html', [chained.origin]).origin.app_name,
+                project.apps[0])
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 9),
+                     'Chains are resolved with skip on Django >= 1.9')
+    def test_load_chain_explicit_app(self):
+        with SyntheticProject(apps=4, templates=1, depth=3,
+                              prefix='explicit') as project:
+            template_name = '%s:chain/template_0.html' % project.apps[1]
+            expected = Engine(loaders=['app_namespace.Loader']).get_template(
+                template_name).render(Context())
+            with self.settings(APP_NAMESPACE_GRAPH=True):
+                engine = Engine(loaders=['app_namespace.Loader'])
+                build_indexes([engine])
+            self.assertEquals(engine.get_template(template_name).render(
+                Context()), expected)
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 9),
+                     'Chains are resolved with skip on Django >= 1.9')
+    def test_built_outside_of_requests(self):
+        with SyntheticProject(apps=3, templates=1, depth=3,
+                              prefix='prebuilt'):
+            with self.settings(APP_NAMESPACE_GRAPH=True,
+                               APP_NAMESPACE_INSTRUMENTATION=True):
+                engine = Engine(loaders=['app_namespace.Loader'])
+                loader = engine.template_loaders[0]
+            template = engine.from_string(
+                '{% extends ":chain/template_0.html" %}')
+            expected = template.render(Context())
+            self.assertEquals(loader._template_graph, None)
+
+            reads = loader.stats.snapshot()['reads']
+            build_indexes([engine])
+            self.assertEquals(loader.stats.snapshot()['reads'], reads)
+            self.assertEquals(template.render(Context()), expected)
+
+    def test_updated_when_watched(self):
+        with SyntheticProject(apps=2, templates=1, depth=2,
+                              prefix='graphwatch') as project:
+            with self.settings(APP_NAMESPACE_GRAPH=True,
+                               APP_NAMESPACE_WATCH=True,
+                               APP_NAMESPACE_WATCH_INTERVAL=0.01):
+                loader = Loader(Engine())
+                graph = loader.template_graph
+            self.addCleanup(loader.watcher.stop)
+            project.write(os.path.join(
+                project.directory, 'graphwatch_app_1', 'templates',
+                'child.html'), '{% extends ":chain/template_0.html" %}')
+            self.assertTrue(wait_for(lambda: len(graph.get_chain(
+                'graphwatch_app_1', 'child.html')) == 3))
+            self.assertTrue(loader._template_graph is graph)
+
+
 class TemplateTestCase(TestCase):
     maxDiff = None
 
@@ -270,21 +1215,24 @@ class ApplicationConfig(AppConfig):
             del sys.modules[app]
         shutil.rmtree(self.app_directory)
 
+    def render_extend_empty_namespace(self):
+        context = Context({})
+        template = Template(
+            self.template_extend % {'app': 'top-level'}
+            ).render(context)
+        previous_app = ''
+        for test_app in ['top-level'] + self.apps:
+            self.assertTrue(test_app in template)
+            if previous_app:
+                self.assertTrue(template.index(test_app) >
+                                template.index(previous_app))
+            previous_app = test_app
+
     def multiple_extend_empty_namespace(self, apps=None):
         if apps is None:
             apps = self.apps
         with self.settings(INSTALLED_APPS=apps):
-            context = Context({})
-            template = Template(
-                self.template_extend % {'app': 'top-level'}
-                ).render(context)
-            previous_app = ''
-            for test_app in ['top-level'] + self.apps:
-                self.assertTrue(test_app in template)
-                if previous_app:
-                    self.assertTrue(template.index(test_app) >
-                                    template.index(previous_app))
-                previous_app = test_app
+            self.render_extend_empty_namespace()
 
     def test_multiple_extend_empty_namespace(self):
         self.multiple_extend_empty_namespace()
@@ -294,6 +1242,30 @@ class ApplicationConfig(AppConfig):
                        for app in self.apps]
         self.multiple_extend_empty_namespace(apps_config)
 
+    @override_settings(APP_NAMESPACE_WATCH=True,
+                       APP_NAMESPACE_WATCH_INTERVAL=0.01)
+    def test_watch_templates(self):
+        with self.settings(INSTALLED_APPS=self.apps):
+            app_namespace_loader = Loader(Engine())
+            self.assertEquals(list(app_namespace_loader.get_template_sources(
+                ':new.html')), [])
+            self.assertTrue(app_namespace_loader.watcher.is_alive())
+
+            new_path = os.path.join(self.app_directory, self.apps[1],
+                                    'templates', 'new.html')
+            with open(new_path, 'w') as f:
+                f.write('new')
+            self.assertTrue(wait_for(
+                lambda: 'new.html' in app_namespace_loader.template_index))
+            self.assertEquals(app_namespace_loader.load_template_source(
+                ':new.html')[0], 'new')
+
+            os.remove(new_path)
+            self.assertTrue(wait_for(
+                lambda: 'new.html' not in
+                app_namespace_loader.template_index))
+            app_namespace_loader.watcher.stop()
+
     @override_settings(
         TEMPLATES=[
             {
@@ -312,6 +1284,105 @@ class ApplicationConfig(AppConfig):
         with self.assertRaises(RuntimeError):
             self.multiple_extend_empty_namespace()
 
+    @override_settings(
+        TEMPLATES=[
+            {
+                'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                'OPTIONS': {
+                    'loaders': [
+                        ('app_namespace.CachedLoader', [
+                            'app_namespace.Loader',
+                            'django.template.loaders.app_directories.Loader']),
+                    ]
+                }
+            }
+        ]
+    )
+    def test_app_namespace_cached_multiple_extend_empty_namespace(self):
+        with self.settings(INSTALLED_APPS=self.apps):
+            self.render_extend_empty_namespace()
+            cached_loader = Engine.get_default().template_loaders[0]
+            self.assertEquals(len(cached_loader.get_template_cache),
+                              len(self.apps))
+            self.render_extend_empty_namespace()
+            self.assertEquals(len(cached_loader.get_template_cache),
+                              len(self.apps))
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_synthetic_project(self):
+        with SyntheticProject(apps=4, templates=2, depth=3,
+                              prefix='project') as project:
+            template = Engine(loaders=['app_namespace.Loader']).from_string(
+                '{% extends ":chain/template_1.html" %}').render(Context())
+            self.assertEquals(template.split(),
+                              ['project_app_0', 'project_app_1',
+                               'project_app_2'])
+            self.assertTrue(os.path.isdir(project.directory))
+        self.assertEquals(project.directory, None)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('app_namespace_benchmark', apps=3, templates=2,
+                     depth=2, repeat=2, stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEquals(results['parameters']['apps'], 3)
+        operations = set((result['loader'], result['operation'])
+                         for result in results['results'])
+        self.assertEquals(len(operations), 9)
+        self.assertTrue(('app_namespace.CachedLoader', 'render')
+                        in operations)
+        self.assertTrue(('app_namespace.CachedLoader', 'render_chain')
+                        in operations)
+        self.assertFalse(('django.template.loaders.app_directories.Loader',
+                          'render_chain') in operations)
+        self.assertTrue(all(result['warm'] >= 0
+                            for result in results['results']))
+
+
+class ProfileTestCase(TestCase):
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = os.path.join(directory, 'profile')
+        out = StringIO()
+        call_command('app_namespace_profile', ':admin/base.html',
+                     'admin:admin/base_invalid.html', output=output,
+                     stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith(
+            'Error rendering admin:admin/base_invalid.html'))
+        self.assertEquals([line.split()[-1] for line in lines[1:8]],
+                          ['registry', 'index', 'lookup', 'read', 'parse',
+                           'render', 'total'])
+        self.assertTrue(os.path.getsize(output + '.prof') > 0)
+        with open(output + '.folded') as fp:
+            stacks = fp.read().splitlines()
+        self.assertTrue(stacks)
+        self.assertTrue(any('(read_contents)' in stack for stack in stacks))
+        self.assertTrue(all(int(stack.rsplit(' ', 1)[1]) > 0
+                            for stack in stacks))
+
+
+class StressTestCase(TestCase):
+
+    def test_command(self):
+        out = StringIO()
+        call_command('app_namespace_stress', apps=4, templates=2, depth=4,
+                     workers='1,4', iterations=3, processes=True, stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEquals(
+            [(result['mode'], result['workers'])
+             for result in results['results']],
+            [('threads', 1), ('threads', 4),
+             ('processes', 1), ('processes', 4)] * 2)
+        for result in results['results']:
+            self.assertEquals(result['mismatches'], [])
+            self.assertEquals(result['renders'], result['workers'] * 12)
+            self.assertTrue(result['renders_per_second'] > 0)
+
 
 class ViewTestCase(TestCase):
 
@@ -0,0 +1,56 @@
+"""Utils for app-namespace"""
+import mmap
+
+from django.utils import six
+
+
+def get_mtime_ns(stat):
+    """
+    Return the modification time of a stat result in nanoseconds.
+    """
+    return getattr(stat, 'st_mtime_ns', int(stat.st_mtime * 1e9))
+
+
+def get_stat_fingerprint(stat):
+    """
+    Return the (inode, mtime, size) of a stat result, changing
+    when a file is modified or replaced by another one.
+    """
+    return (stat.st_ino, get_mtime_ns(stat), stat.st_size)
+
+
+def decode_source(data, encoding):
+    """
+    Decode the content of a template, translating
+    the newlines like a file opened in text mode.
+    """
+    source = six.text_type(data, encoding)
+    if '\r' in source:
+        source = source.replace('\r\n', '\n').replace('\r', '\n')
+    return source
+
+
+def read_file(path, encoding, stat):
+    """
+    Read and decode a template whose stat result is known.
+    """
+    return read_mmap(path, stat.st_size, encoding)
+
+
+def read_mmap(path, size, encoding):
+    """
+    Read and decode a template of 'size' bytes through a memory map,
+    or directly if the file can not be mapped, as when truncated
+    since 'size' was given or on a filesystem without mmap support.
+    """
+    if not size:
+        return six.text_type()
+    with open(path, 'rb') as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            return decode_source(fp.read(), encoding)
+        try:
+            return decode_source(data, encoding)
+        finally:
+            data.close()
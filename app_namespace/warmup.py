@@ -0,0 +1,142 @@
+"""Warm-up of the template loaders for app-namespace"""
+import time
+from multiprocessing.pool import ThreadPool
+
+from app_namespace.loader import Loader
+
+from django.template import Context
+from django.template import TemplateDoesNotExist
+from django.template import engines as template_engines
+from django.template.base import Variable
+from django.template.loader_tags import ExtendsNode
+
+
+def get_namespace_loaders(engine):
+    """
+    Return the app namespace loaders used by an engine,
+    including those wrapped by a cached loader.
+    """
+    namespace_loaders = []
+    loaders = list(engine.template_loaders)
+    while loaders:
+        loader = loaders.pop(0)
+        if isinstance(loader, Loader):
+            namespace_loaders.append(loader)
+        elif hasattr(loader, 'loaders'):
+            loaders.extend(loader.loaders)
+    return namespace_loaders
+
+
+def get_template_names(loader):
+    """
+    Return the namespaced names of all the templates indexed by a loader,
+    with an empty namespace and with the names and the labels
+    of the applications providing them.
+    """
+    aliases = {}
+    template_index = loader.template_index
+    for alias in loader.app_templates_dirs:
+        aliases.setdefault(loader.app_aliases[alias], []).append(alias)
+
+    template_names = []
+    for template_path, apps in sorted(template_index.templates.items()):
+        template_names.append(':%s' % template_path)
+        for app in apps:
+            template_names.extend('%s:%s' % (alias, template_path)
+                                  for alias in aliases[app])
+    return template_names
+
+
+def get_engines():
+    """
+    Return the engines of the DjangoTemplates backends.
+    """
+    return [backend.engine for backend in template_engines.all()
+            if hasattr(backend, 'engine')]
+
+
+def get_parent_name(template):
+    """
+    Return the literal name of the template extended by a template,
+    or None if it does not extend a template named literally.
+    """
+    for node in template.nodelist:
+        if isinstance(node, ExtendsNode):
+            if node.parent_name.filters or isinstance(
+                    node.parent_name.var, Variable):
+                return None
+            return node.parent_name.resolve(Context())
+    return None
+
+
+def load_chain(engine, template):
+    """
+    Load the templates extended from a template like the extends tag
+    does, the recursive loaders keying them by the origins skipped.
+    """
+    if not all(getattr(loader, 'supports_recursion', False)
+               for loader in engine.template_loaders):
+        return
+    history = [template.origin]
+    parent_name = get_parent_name(template)
+    while parent_name:
+        try:
+            template, origin = engine.find_template(
+                parent_name, skip=history)
+        except TemplateDoesNotExist:
+            return
+        history.append(origin)
+        parent_name = get_parent_name(template)
+
+
+def build_indexes(engines=None):
+    """
+    Build the template indexes of the app namespace loaders of the
+    engines, and their template graphs if enabled. Called in the master
+    process of a preforking server, the indexes are shared with the
+    workers instead of being rebuilt by each of them.
+    """
+    if engines is None:
+        engines = get_engines()
+    for engine in engines:
+        for loader in get_namespace_loaders(engine):
+            loader.template_index
+            if loader.graph:
+                loader.template_graph
+
+
+def warmup(engines=None, concurrency=4):
+    """
+    Resolve and compile every namespaced template of the engines
+    and the templates of its inheritance chain with a pool of threads,
+    to populate the caches of the loaders before serving the first
+    requests.
+
+    Return a list of (template_name, duration, error) for each template.
+    """
+    if engines is None:
+        engines = get_engines()
+    build_indexes(engines)
+
+    tasks = []
+    for engine in engines:
+        for loader in get_namespace_loaders(engine):
+            tasks.extend((engine, template_name)
+                         for template_name in get_template_names(loader))
+
+    def load(task):
+        engine, template_name = task
+        error = None
+        start = time.time()
+        try:
+            load_chain(engine, engine.get_template(template_name))
+        except Exception as exception:
+            error = exception
+        return template_name, time.time() - start, error
+
+    pool = ThreadPool(max(concurrency, 1))
+    try:
+        return pool.map(load, tasks)
+    finally:
+        pool.close()
+        pool.join()
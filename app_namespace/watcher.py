@@ -0,0 +1,256 @@
+"""Watchers of the templates directories for app-namespace"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import weakref
+
+from app_namespace.index import walk_templates_dir
+from app_namespace.utils import get_stat_fingerprint
+
+CREATED = 'created'
+DELETED = 'deleted'
+MODIFIED = 'modified'
+
+
+def get_fingerprint(path):
+    """
+    Return the (inode, mtime, size) of a file or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return get_stat_fingerprint(stat)
+
+
+def load_libc():
+    """
+    Return the C library providing the inotify API, or None.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):  # pragma: no cover
+        return None
+    return libc
+
+
+class BaseWatcher(threading.Thread):
+    """
+    Daemon thread watching the templates directories and notifying
+    'target.template_changed(templates_dir, template_path, event)'
+    for each template created, deleted or modified.
+
+    The target is weakly referenced, the thread stops
+    when the target is garbage collected.
+    """
+    interval = 1.0
+
+    def __init__(self, templates_dirs, target, interval=None):
+        super(BaseWatcher, self).__init__(name='app-namespace-watcher')
+        self.daemon = True
+        self.templates_dirs = list(templates_dirs)
+        self.target = weakref.ref(target)
+        if interval is not None:
+            self.interval = interval
+        self.stopped = threading.Event()
+        self.files = {}
+        for templates_dir in self.templates_dirs:
+            self.files[templates_dir] = self.scan(templates_dir)
+
+    def scan(self, templates_dir):
+        """
+        Return the fingerprints of the templates of a directory.
+        """
+        return dict((template_path, get_fingerprint(
+            os.path.join(templates_dir, template_path)))
+            for template_path in walk_templates_dir(templates_dir))
+
+    def rescan(self, templates_dir):
+        """
+        Notify the differences between the templates known
+        and the templates present in a directory.
+        """
+        known = self.files[templates_dir]
+        current = self.scan(templates_dir)
+        self.files[templates_dir] = current
+        for template_path in sorted(set(known) - set(current)):
+            self.notify(templates_dir, template_path, DELETED)
+        for template_path, fingerprint in sorted(current.items()):
+            if template_path not in known:
+                self.notify(templates_dir, template_path, CREATED)
+            elif known[template_path] != fingerprint:
+                self.notify(templates_dir, template_path, MODIFIED)
+
+    def notify(self, templates_dir, template_path, event):
+        """
+        Send the event to the target if it is still alive.
+        """
+        target = self.target()
+        if target is None:
+            self.stop()
+        else:
+            target.template_changed(templates_dir, template_path, event)
+
+    def is_watching(self):
+        return (not self.stopped.is_set() and
+                self.target() is not None)
+
+    def stop(self):
+        self.stopped.set()
+
+
+class PollingWatcher(BaseWatcher):
+    """
+    Watcher comparing the modification times and sizes
+    of the templates at regular intervals.
+    """
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if self.target() is None:
+                break
+            for templates_dir in self.templates_dirs:
+                self.rescan(templates_dir)
+
+
+class InotifyWatcher(BaseWatcher):
+    """
+    Watcher relying on the inotify API of the Linux kernel.
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    mask = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+            IN_CREATE | IN_DELETE)
+    event_header = struct.Struct('iIII')
+
+    libc = None
+    libc_loaded = False
+
+    def __init__(self, *args, **kwargs):
+        if not self.is_available():
+            raise OSError(errno.ENOSYS, 'inotify unavailable')
+        super(InotifyWatcher, self).__init__(*args, **kwargs)
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self.watches = {}
+        for templates_dir in self.templates_dirs:
+            self.add_watches(templates_dir)
+
+    @classmethod
+    def is_available(cls):
+        """
+        Check if inotify is available, loading the C library on the
+        first call only, finding it running ldconfig in a subprocess.
+        """
+        if not cls.libc_loaded:
+            cls.libc = load_libc()
+            cls.libc_loaded = True
+        return cls.libc is not None
+
+    def add_watches(self, templates_dir):
+        """
+        Watch recursively the directories of a templates directory.
+        """
+        encoding = sys.getfilesystemencoding()
+        for root, dirs, files in os.walk(templates_dir, followlinks=True):
+            path = root
+            if not isinstance(path, bytes):
+                path = path.encode(encoding)
+            wd = self.libc.inotify_add_watch(self.fd, path, self.mask)
+            if wd >= 0:
+                self.watches[wd] = (templates_dir, root)
+
+    def run(self):
+        try:
+            while self.is_watching():
+                readable = select.select([self.fd], [], [], self.interval)[0]
+                if readable:
+                    self.dispatch(os.read(self.fd, 65536))
+        finally:
+            os.close(self.fd)
+
+    def dispatch(self, data):
+        """
+        Notify the events read from the inotify file descriptor.
+        """
+        encoding = sys.getfilesystemencoding()
+        rescans = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.event_header.unpack_from(
+                data, offset)
+            offset += self.event_header.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & self.IN_Q_OVERFLOW:
+                rescans.update(self.templates_dirs)
+                continue
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches or not name:
+                continue
+            templates_dir, directory = self.watches[wd]
+            if mask & self.IN_ISDIR:
+                rescans.add(templates_dir)
+                continue
+            if not isinstance(directory, bytes):
+                name = name.decode(encoding)
+            self.file_changed(templates_dir, os.path.relpath(
+                os.path.join(directory, name), templates_dir), mask)
+
+        for templates_dir in rescans:
+            self.add_watches(templates_dir)
+            self.rescan(templates_dir)
+
+    def file_changed(self, templates_dir, template_path, mask):
+        template_path = template_path.replace(os.sep, '/')
+        known = self.files[templates_dir]
+        if mask & (self.IN_MOVED_FROM | self.IN_DELETE):
+            if template_path in known:
+                del known[template_path]
+                self.notify(templates_dir, template_path, DELETED)
+            return
+        fingerprint = get_fingerprint(
+            os.path.join(templates_dir, template_path))
+        if template_path not in known:
+            known[template_path] = fingerprint
+            self.notify(templates_dir, template_path, CREATED)
+        elif mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+            known[template_path] = fingerprint
+            self.notify(templates_dir, template_path, MODIFIED)
+
+
+def get_watcher(templates_dirs, target, interval=None):
+    """
+    Return a started watcher of the templates directories,
+    using inotify if available, otherwise polling.
+    """
+    watcher_class = PollingWatcher
+    if InotifyWatcher.is_available():
+        watcher_class = InotifyWatcher
+    try:
+        watcher = watcher_class(templates_dirs, target, interval)
+    except OSError as error:  # pragma: no cover
+        if error.errno not in (errno.EMFILE, errno.ENOSPC):
+            raise
+        watcher = PollingWatcher(templates_dirs, target, interval)
+    watcher.start()
+    return watcher